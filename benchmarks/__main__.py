@@ -0,0 +1,106 @@
+#! /usr/bin/env python3
+
+##
+# Runs the benchmark suites and writes the results as JSON, optionally
+# compared to a previous run to spot regressions
+#
+# usage: python -m benchmarks [--only micro,transport] [--output results.json]
+#                             [--compare baseline.json] [--tolerance 0.2]
+##
+
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+
+from . import bench_micro, bench_codec, bench_checksum, bench_transport, bench_cycle
+
+SUITES = {
+    "micro": bench_micro.run,
+    "codec": bench_codec.run,
+    "checksum": bench_checksum.run,
+    "transport": bench_transport.run,
+    "cycle": bench_cycle.run,
+}
+
+def flatten(results: dict, prefix="") -> dict:
+    flat = dict()
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        else:
+            flat[prefix + key] = value
+    return flat
+
+def direction(name: str) -> int:
+    """+1 if higher is better, -1 if lower is better, 0 for informational values"""
+    if name.endswith(("_us", "_ms")):
+        return -1
+    if name.endswith(("rps", "_per_s")):
+        return 1
+    return 0
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Metrics more than `tolerance` (relative) worse than the baseline"""
+    regressions = list()
+    current, previous = flatten(results), flatten(baseline)
+
+    for name, value in current.items():
+        sign = direction(name)
+        old = previous.get(name)
+        if not sign or not old:
+            continue
+
+        change = (value - old) / old * sign
+        if change < -tolerance:
+            regressions.append(f"{name}: {old:.3f} -> {value:.3f} ({change:+.0%})")
+
+    return regressions
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the xcom_proto benchmarks")
+    parser.add_argument("--only", help="comma separated suites among " + ", ".join(SUITES))
+    parser.add_argument("--output", help="JSON file to write, stdout by default")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON results of a previous run")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative change reported as a regression")
+    args = parser.parse_args()
+
+    suites = args.only.split(",") if args.only else list(SUITES)
+    results = {"meta": metadata()}
+    for suite in suites:
+        print(f"running {suite}...", file=sys.stderr)
+        results[suite] = SUITES[suite]()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        baseline.pop("meta", None)
+
+        regressions = compare({k: v for k, v in results.items() if k != "meta"}, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,56 @@
+#! /usr/bin/env python3
+
+##
+# Checksum benchmark and cross-check against the original implementation
+#
+# usage: python -m benchmarks.bench_checksum
+##
+
+import os
+import timeit
+
+from xcom_proto.protocol import Fletcher, checksum
+
+from . import legacy_protocol as legacy
+
+SIZES = (11, 14, 64, 256, 1024, 4096, 65536)
+
+def verify():
+    """checksum() and incremental Fletcher must match the original byte by byte"""
+    for size in list(range(64)) + [1023, 1024, 1025, 4095, 4096, 4097, 70000]:
+        data = os.urandom(size)
+        expected = legacy.checksum(data)
+
+        assert checksum(data) == expected, f"checksum mismatch for {size} bytes"
+        assert checksum(memoryview(data)) == expected, f"memoryview mismatch for {size} bytes"
+
+        incremental = Fletcher()
+        for start in range(0, size, 7):
+            incremental.update(data[start:start + 7])
+        assert incremental.digest() == expected, f"incremental mismatch for {size} bytes"
+
+def bench(stmt, number: int) -> float:
+    """best of 5, in microseconds per call"""
+    return min(timeit.repeat(stmt, number=number, repeat=5)) / number * 1e6
+
+def run() -> dict:
+    verify()
+
+    results = dict()
+    for size in SIZES:
+        data = os.urandom(size)
+        number = max(10, 50000 // size)
+
+        results[f"checksum_legacy_{size}_us"] = bench(lambda: legacy.checksum(data), number)
+        results[f"checksum_{size}_us"] = bench(lambda: checksum(data), number)
+
+    return results
+
+if __name__ == "__main__":
+    results = run()
+
+    print(f"{'size':>8} {'legacy us':>12} {'new us':>12} {'speedup':>8}")
+    for size in SIZES:
+        old = results[f"checksum_legacy_{size}_us"]
+        new = results[f"checksum_{size}_us"]
+        print(f"{size:>8} {old:>12.2f} {new:>12.2f} {old / new:>7.2f}x")
@@ -0,0 +1,65 @@
+#! /usr/bin/env python3
+
+##
+# Package codec benchmark, compared to the previous BytesIO based codec
+#
+# usage: python -m benchmarks.bench_codec
+##
+
+import sys
+import struct
+import timeit
+
+from xcom_proto.parameters import *
+from xcom_proto.protocol import Package
+
+from . import legacy_protocol as legacy
+
+def samplePackages(module) -> tuple:
+    request = module.Package.genPackage(
+        service_id=PROPERTY_READ,
+        object_id=3136,
+        object_type=TYPE_INFO,
+        property_id=QSP_VALUE,
+        property_data=b'',
+        dst_addr=100
+    )
+
+    response = module.Package.genPackage(
+        service_id=PROPERTY_READ,
+        object_id=3136,
+        object_type=TYPE_INFO,
+        property_id=QSP_VALUE,
+        property_data=struct.pack("<f", 1.25),
+        src_addr=100,
+        dst_addr=1
+    )
+    response.frame_data.service_flags = 2
+
+    return request, response.getBytes()
+
+def bench(stmt, number: int) -> float:
+    """best of 5, in microseconds per call"""
+    return min(timeit.repeat(stmt, number=number, repeat=5)) / number * 1e6
+
+def run(number=20000) -> dict:
+    legacyRequest, legacyRaw = samplePackages(legacy)
+    request, raw = samplePackages(sys.modules[Package.__module__])
+
+    assert legacyRequest.getBytes() == request.getBytes(), "encoders disagree"
+    assert legacyRaw == raw, "encoders disagree"
+
+    return {
+        "encode_legacy_us": bench(legacyRequest.getBytes, number),
+        "encode_us": bench(request.getBytes, number),
+        "decode_legacy_us": bench(lambda: legacy.Package.parseBytes(raw), number),
+        "decode_us": bench(lambda: Package.parseBytes(raw), number),
+    }
+
+if __name__ == "__main__":
+    results = run()
+    for name, value in results.items():
+        print(f"{name:>20}: {value:8.2f}")
+
+    print(f"{'encode speedup':>20}: {results['encode_legacy_us'] / results['encode_us']:8.2f}x")
+    print(f"{'decode speedup':>20}: {results['decode_legacy_us'] / results['decode_us']:8.2f}x")
@@ -0,0 +1,87 @@
+#! /usr/bin/env python3
+
+##
+# End-to-end benchmark of a studer.py poll cycle: every entry of the polling
+# profile read through the scheduler, converted, filtered and published (to
+# a no-op MQTT client), against the gateway emulator
+#
+# usage: python -m benchmarks.bench_cycle
+##
+
+import time
+
+from xcom_proto import XcomRS232, XcomLANUDP, PollScheduler
+from polling_profile import POLLING_PROFILE
+from publishing import ChangeFilter, GroupPublisher
+
+from .bench_transport import emulator, freePort
+
+def cycles(xcom, count: int, jsonGroups=False, readMany=None) -> dict:
+    scheduler = PollScheduler(POLLING_PROFILE, busShare=1e9)
+    changeFilter = ChangeFilter()
+    groups = GroupPublisher("home/sensor/") if jsonGroups else None
+    published = list()
+    errors = list()
+
+    def read(entry):
+        return xcom.getValue(entry.datapoint, entry.dstAddr)
+
+    def onValue(entry, value):
+        value = entry.convert(value)
+        if not changeFilter.shouldPublish(entry.topic, value, entry.rule):
+            return
+        if groups is not None:
+            groups.update(entry, value)
+        else:
+            published.append((entry.topic, value))
+
+    def onError(entry, e):
+        # ids shared by datapoints of different types in the Dataset cannot
+        # all be decoded, they fail on every cycle
+        errors.append(entry)
+
+    reads = 0
+    wall = time.perf_counter()
+    cpu = time.process_time()
+
+    for _ in range(count):
+        # every entry due, one cycle reads the whole profile
+        for entry in scheduler.entries:
+            entry.nextDue = 0
+        reads += len(scheduler.step(read, onValue, onError, readMany))
+        if groups is not None:
+            groups.flush(lambda topic, payload: published.append((topic, payload)))
+
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+
+    return {
+        "datapoints_per_s": reads / wall,
+        "cycle_ms": wall / count * 1e3,
+        "cpu_per_cycle_ms": cpu / count * 1e3,
+        "published_per_cycle": len(published) / count,
+        "errors_per_cycle": len(errors) / count,
+    }
+
+def run(count=20) -> dict:
+    results = dict()
+
+    with emulator("--pty") as pty:
+        with XcomRS232(pty, 115200) as xcom:
+            results["rs232"] = cycles(xcom, count)
+            results["rs232_json"] = cycles(xcom, count, jsonGroups=True)
+
+    dstPort, srcPort = freePort(), freePort()
+    with emulator("--udp", dstPort, "--udp-reply", srcPort):
+        with XcomLANUDP("127.0.0.1", dstPort, srcPort) as xcom:
+            readMany = lambda batch: xcom.getValuesFrom(
+                [(e.datapoint, e.dstAddr) for e in batch], return_exceptions=True)
+
+            results["udp"] = cycles(xcom, count)
+            results["udp_pipelined"] = cycles(xcom, count, readMany=readMany)
+
+    return results
+
+if __name__ == "__main__":
+    for name, values in run().items():
+        print(f"{name:>14}: " + ", ".join(f"{key} {value:.2f}" for key, value in values.items()))
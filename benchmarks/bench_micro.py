@@ -0,0 +1,46 @@
+#! /usr/bin/env python3
+
+##
+# Micro benchmarks of the hot paths of a poll: encoding a request, decoding
+# its response, checksum, value decoding and datapoint lookups
+#
+# usage: python -m benchmarks.bench_micro
+##
+
+import struct
+import timeit
+
+from xcom_proto import XcomP
+from xcom_proto.parameters import *
+from xcom_proto.protocol import Package, checksum
+
+def bench(stmt, number: int) -> float:
+    """best of 5, in microseconds per call"""
+    return min(timeit.repeat(stmt, number=number, repeat=5)) / number * 1e6
+
+def run(number=20000) -> dict:
+    request = Package.genPackage(PROPERTY_READ, 3000, TYPE_INFO, QSP_VALUE, b'', dst_addr=100)
+
+    response = Package.genPackage(PROPERTY_READ, 3000, TYPE_INFO, QSP_VALUE, struct.pack("<f", 51.2),
+        src_addr=100, dst_addr=1)
+    response.frame_data.service_flags = 2
+    raw = response.getBytes()
+
+    header = raw[1:12]
+    value = struct.pack("<f", 51.2)
+    point = XcomP.AC_POWER_OUT
+    registry = Dataset.registry()
+
+    return {
+        "package_get_bytes_us": bench(request.getBytes, number),
+        "package_parse_bytes_us": bench(lambda: Package.parseBytes(raw), number),
+        "checksum_header_us": bench(lambda: checksum(header), number),
+        "unpack_value_us": bench(lambda: point.unpackValue(value), number),
+        "get_param_by_id_us": bench(lambda: Dataset.getParamByID(point.id), number),
+        "get_param_by_name_us": bench(lambda: Dataset.getParamByName("AC_POWER_OUT"), number),
+        "registry_get_by_id_us": bench(lambda: registry.getByID(point.id), number),
+    }
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name:>24}: {value:8.3f}")
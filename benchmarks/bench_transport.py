@@ -0,0 +1,95 @@
+#! /usr/bin/env python3
+
+##
+# Transport benchmark: requests per second and latency percentiles of every
+# XcomAbs implementation against the gateway emulator, started in its own
+# process so that it does not compete with the client for the GIL
+#
+# usage: python -m benchmarks.bench_transport
+##
+
+import sys
+import time
+import socket
+import subprocess
+
+from contextlib import contextmanager
+
+from xcom_proto import XcomP, XcomRS232, XcomLANTCP, XcomLANUDP
+
+POINTS = [XcomP.AC_POWER_OUT, XcomP.AC_POWER_IN, XcomP.AC_FREQ_OUT, XcomP.AC_VOLTAGE_IN]
+
+def freePort(kind=socket.SOCK_DGRAM) -> int:
+    with socket.socket(socket.AF_INET, kind) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+@contextmanager
+def emulator(*args, latency=0.0):
+    """Emulator subprocess, yields the first line it prints (the pty with --pty)"""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "xcom_proto.emulator", "--latency", str(latency), *map(str, args)],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        line = process.stdout.readline().strip() if "--pty" in args else None
+        # give the UDP socket time to be bound
+        time.sleep(0.3)
+        yield line
+    finally:
+        process.terminate()
+        process.wait()
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def measure(xcom, requests: int) -> dict:
+    latencies = list()
+
+    start = time.perf_counter()
+    for i in range(requests):
+        t = time.perf_counter()
+        xcom.getValue(POINTS[i % len(POINTS)])
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "rps": requests / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1e3,
+        "p99_ms": percentile(latencies, 99) * 1e3,
+    }
+
+def measureBatch(xcom, requests: int) -> dict:
+    """Reads issued with getValues, overlapped by transports which pipeline requests"""
+    batch = POINTS * 4
+
+    start = time.perf_counter()
+    for _ in range(max(1, requests // len(batch))):
+        xcom.getValues(batch)
+    elapsed = time.perf_counter() - start
+
+    return {"batch_rps": max(1, requests // len(batch)) * len(batch) / elapsed}
+
+def run(requests=500, latency=0.0) -> dict:
+    results = dict()
+
+    with emulator("--pty", latency=latency) as pty:
+        with XcomRS232(pty, 115200) as xcom:
+            results["rs232"] = measure(xcom, requests)
+
+    dstPort, srcPort = freePort(), freePort()
+    with emulator("--udp", dstPort, "--udp-reply", srcPort, latency=latency):
+        with XcomLANUDP("127.0.0.1", dstPort, srcPort) as xcom:
+            results["udp"] = measure(xcom, requests)
+            results["udp"].update(measureBatch(xcom, requests))
+
+    port = freePort(socket.SOCK_STREAM)
+    with emulator("--tcp", port, latency=latency):
+        with XcomLANTCP(port) as xcom:
+            results["tcp"] = measure(xcom, requests)
+
+    return results
+
+if __name__ == "__main__":
+    for transport, values in run().items():
+        print(f"{transport:>6}: " + ", ".join(f"{name} {value:.2f}" for name, value in values.items()))
@@ -0,0 +1,75 @@
+##
+# Appareils et datapoints pris en charge par chaque passerelle, trouvés au
+# démarrage et conservés sur disque pour ne pas refaire la recherche à
+# chaque lancement. Les datapoints qui ne répondront jamais (appareil absent,
+# objet inconnu du firmware, ...) ne sont plus lus.
+##
+
+import os
+import json
+import time
+import tempfile
+import threading
+
+# les passerelles partagent le fichier, chacune avec sa propre instance
+_lock = threading.Lock()
+
+class CapabilityCache:
+    """Fichier JSON : {passerelle: {"probed": ..., "devices": {...}, "unsupported": [[nom, adresse], ...]}}"""
+
+    def __init__(self, path: str, maxAge: float):
+        self.path = path
+        self.maxAge = maxAge
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return dict()
+        except (OSError, ValueError) as e:
+            print(f"Cache des capacités illisible ({e}), nouvelle recherche")
+            return dict()
+
+    def get(self, key: str) -> dict:
+        """Résultat de la dernière recherche de la passerelle, None s'il est absent ou trop ancien"""
+        with _lock:
+            entry = self._load().get(key)
+        if entry is None or time.time() - entry.get("probed", 0) >= self.maxAge:
+            return None
+        return entry
+
+    def put(self, key: str, entry: dict):
+        # lecture, modification et écriture sans qu'une autre passerelle
+        # n'écrive entre-temps (son entrée serait perdue)
+        with _lock:
+            entries = self._load()
+            entries[key] = entry
+
+            # remplacement atomique, un arrêt pendant l'écriture ne corrompt pas le cache
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", dir=directory, prefix=".capabilities-", delete=False) as f:
+                try:
+                    json.dump(entries, f, indent=2, sort_keys=True)
+                    f.flush()
+                    os.fsync(f.fileno())
+                except BaseException:
+                    os.unlink(f.name)
+                    raise
+            os.replace(f.name, self.path)
+
+def probe(xcom, devices: dict, profile: list) -> dict:
+    """Lit une fois chaque datapoint du profil, retourne l'entrée à mettre en cache"""
+    reads = dict()
+    for entry in profile:
+        reads.setdefault((entry.datapoint.name, entry.dstAddr), (entry.datapoint, entry.dstAddr))
+
+    supported = xcom.probeDatapoints(list(reads.values()))
+    unsupported = [list(key) for key, ok in zip(reads, supported) if ok is False]
+
+    return {"probed": time.time(), "devices": devices, "unsupported": sorted(unsupported)}
+
+def supportedProfile(profile: list, capabilities: dict) -> list:
+    unsupported = set(map(tuple, capabilities["unsupported"]))
+    return [e for e in profile if (e.datapoint.name, e.dstAddr) not in unsupported]
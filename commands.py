@@ -0,0 +1,242 @@
+##
+# Écriture des paramètres depuis MQTT : une valeur publiée sur
+# <topic>set/<paramètre> (ou <topic>set/<type>/<adresse>/<paramètre> pour une
+# seule unité) est placée dans une file, vidée par le thread de la passerelle
+# avant les lectures du polling
+##
+
+import json
+import math
+import time
+import struct
+import threading
+
+from dataclasses import dataclass, field
+
+from xcom_proto import XcomP as param
+from xcom_proto.parameters import (Datapoint, TYPE_BOOL, TYPE_FLOAT, QSP_VALUE, QSP_UNSAVED_VALUE,
+    QSP_MIN, QSP_MAX, DEVICE_ADDR_RANGES, getDeviceType, getDefaultAddress)
+
+# paramètres modifiables, le topic de commande est leur nom en minuscules
+WRITABLE_PARAMETERS = [
+    param.MAX_CURR_AC_SOURCE,
+    param.SMART_BOOST_ALLOWED,
+    param.BATTERY_CHARGE_CURR,
+    param.MAX_GRID_FEEDING_CURR,
+    param.SMART_BOOST_LIMIT,
+    param.BATT_ABSORPTION_VOLTAGE,
+    param.BATT_FLOATING_VOLTAGE,
+    param.BATT_EQUALIZATION_VOLTAGE,
+    param.BATT_UNDERVOLTAGE,
+    param.BATT_TEMP_COMPENSATION,
+    param.INVERTER_OUTPUT_VOLTAGE,
+    param.INVERTER_OUTPUT_FREQUENCY,
+    param.ECO_MODE_ENABLED,
+    param.GRID_FEEDING_ALLOWED,
+    param.GRID_FEEDING_POWER_LIMIT,
+    param.TRANSFER_RELAY_ENABLED,
+    param.PARAMS_SAVED_IN_FLASH,
+    param.SOC_LEVEL_FOR_BACKUP,
+    param.SOC_LEVEL_FOR_GRID_FEEDING,
+    param.FORCE_NEW_CYCLE,
+]
+
+COMMANDS = {p.name.lower(): p for p in WRITABLE_PARAMETERS}
+
+# paramètres déclenchant une action, écrits même si la valeur est inchangée
+SIGNALS = (param.FORCE_NEW_CYCLE,)
+
+# durée pendant laquelle la valeur connue d'un paramètre est considérée à jour
+# (elle peut avoir été modifiée depuis la RCC)
+VALUE_MAX_AGE = 600
+
+TRUE_WORDS = ("ON", "TRUE", "YES", "1")
+FALSE_WORDS = ("OFF", "FALSE", "NO", "0")
+
+def parseCommand(path: str) -> tuple[Datapoint, int]:
+    """Paramètre et adresse d'un topic de commande (sans <topic>set/)"""
+    parts = path.split("/")
+    datapoint = COMMANDS.get(parts[-1])
+    if datapoint is None:
+        raise ValueError(f"paramètre non modifiable : {parts[-1]}")
+
+    if len(parts) == 1:
+        return datapoint, getDefaultAddress(datapoint.id)
+
+    deviceType = getDeviceType(datapoint.id)
+    if len(parts) != 3 or parts[0] != deviceType or not parts[1].isdigit() \
+            or int(parts[1]) not in DEVICE_ADDR_RANGES[deviceType]:
+        raise ValueError(f"topic de commande invalide : {path}")
+    return datapoint, int(parts[1])
+
+def parseValue(datapoint: Datapoint, payload: bytes):
+    """Valeur d'une commande : nombre, ON / OFF, true / false ou {"value": ...}"""
+    text = payload.decode(errors="replace").strip()
+    try:
+        value = json.loads(text)
+    except ValueError:
+        value = text
+    if isinstance(value, dict):
+        value = value.get("value")
+
+    # listes, null, ... : float() / int() lèveraient TypeError
+    if not isinstance(value, (int, float, str)):
+        raise ValueError(f"valeur invalide pour {datapoint.name} : {text}")
+
+    if datapoint.type == TYPE_BOOL:
+        if isinstance(value, str):
+            if value.upper() not in TRUE_WORDS + FALSE_WORDS:
+                raise ValueError(f"valeur invalide pour {datapoint.name} : {text}")
+            return value.upper() in TRUE_WORDS
+        return bool(value)
+
+    if isinstance(value, bool):
+        raise ValueError(f"valeur invalide pour {datapoint.name} : {text}")
+
+    try:
+        if datapoint.type == TYPE_FLOAT:
+            value = float(value)
+        elif isinstance(value, float) and not value.is_integer():
+            raise ValueError
+        else:
+            value = int(value)
+        # NaN, infini ou valeur qui ne tient pas dans le type du paramètre (1e40)
+        if not math.isfinite(value):
+            raise ValueError
+        datapoint.packValue(value)
+    except (ValueError, OverflowError, struct.error):
+        raise ValueError(f"valeur invalide pour {datapoint.name} : {text}") from None
+
+    return value
+
+@dataclass
+class Command:
+    datapoint: Datapoint
+    dstAddr: int
+    value: object
+    topic: str              # topic où la valeur écrite est publiée
+    flash: bool = False     # écrite en flash (QSP_VALUE) plutôt qu'en mémoire vive
+    priority: int = 0       # plus petite d'abord
+    received: float = field(default_factory=time.monotonic)
+    order: int = 0
+
+    @property
+    def propertyID(self) -> bytes:
+        return QSP_VALUE if self.flash else QSP_UNSAVED_VALUE
+
+class CommandQueue:
+    """
+    File des écritures d'une passerelle. Une nouvelle valeur pour un
+    paramètre encore en attente remplace l'ancienne, qui n'est jamais écrite.
+    Une valeur égale à la valeur connue du paramètre (dernière écriture, ou
+    lecture avant une écriture en flash) n'est pas écrite : la flash de
+    l'onduleur a un nombre de cycles d'écriture limité.
+
+    Les paramètres de `flash` (noms du Dataset) sont écrits en flash, les
+    autres en mémoire vive seulement (perdus au redémarrage de l'onduleur).
+    """
+
+    def __init__(self, flash=(), priorities: dict[str, int] = None):
+        self.flash = set(flash)
+        self.priorities = priorities or dict()
+        self.received = 0
+        self.coalesced = 0
+        self.written = 0
+        self.skipped = 0
+
+        self._pending: dict[tuple, Command] = dict()
+        self._lock = threading.Lock()
+        self._order = 0
+
+        # (id, adresse, propriété) -> (valeur, instant où elle était à jour)
+        self._values: dict[tuple, tuple] = dict()
+        # (id, adresse) -> (minimum, maximum) lus sur l'appareil
+        self._limits: dict[tuple, tuple] = dict()
+
+    def check(self, datapoint: Datapoint, dstAddr: int, value):
+        """Lève ValueError si la valeur sort des limites du paramètre, connues après sa première écriture"""
+        limits = self._limits.get((datapoint.id, dstAddr))
+        if limits is not None and datapoint.type != TYPE_BOOL and not limits[0] <= value <= limits[1]:
+            raise ValueError(f"{datapoint.name} : {value} hors des limites [{limits[0]}, {limits[1]}]")
+
+    def put(self, datapoint: Datapoint, dstAddr: int, value, topic: str) -> bool:
+        """Ajoute une écriture, retourne False si elle remplace une écriture en attente"""
+        key = (datapoint.id, dstAddr)
+
+        with self._lock:
+            self.received += 1
+            pending = self._pending.get(key)
+            if pending is not None:
+                pending.value = value
+                self.coalesced += 1
+                return False
+
+            self._order += 1
+            self._pending[key] = Command(datapoint, dstAddr, value, topic,
+                flash=datapoint.name in self.flash,
+                priority=self.priorities.get(datapoint.name, 0),
+                order=self._order)
+            return True
+
+    def take(self) -> Command:
+        """Prochaine écriture à faire, None si la file est vide"""
+        with self._lock:
+            if not self._pending:
+                return None
+            command = min(self._pending.values(), key=lambda c: (c.priority, c.order))
+            del self._pending[(command.datapoint.id, command.dstAddr)]
+            return command
+
+    def execute(self, xcom, command: Command) -> bool:
+        """Écrit la commande, retourne False si le paramètre avait déjà cette valeur"""
+        datapoint = command.datapoint
+        key = (datapoint.id, command.dstAddr, command.propertyID)
+        now = time.monotonic()
+
+        # limites lues une fois, avant la première écriture du paramètre
+        if datapoint.type != TYPE_BOOL and (datapoint.id, command.dstAddr) not in self._limits:
+            try:
+                self._limits[(datapoint.id, command.dstAddr)] = (
+                    xcom.getValue(datapoint, command.dstAddr, QSP_MIN),
+                    xcom.getValue(datapoint, command.dstAddr, QSP_MAX))
+            except Exception:
+                # sans limites connues, l'appareil refuse lui-même une valeur invalide
+                pass
+        self.check(datapoint, command.dstAddr, command.value)
+
+        known = self._values.get(key)
+        if known is not None and now - known[1] > VALUE_MAX_AGE:
+            known = None
+
+        if known is None and command.flash:
+            # une lecture coûte moins qu'une écriture inutile en flash
+            try:
+                known = (xcom.getValue(datapoint, command.dstAddr, command.propertyID), now)
+            except Exception:
+                known = None
+
+        if known is not None and datapoint not in SIGNALS and datapoint.packValue(known[0]) == datapoint.packValue(command.value):
+            self.skipped += 1
+            return False
+
+        # écrite ou non, la valeur connue n'est plus sûre, y compris celle des
+        # unités (ou de l'adresse multicast) du même paramètre
+        for k in [k for k in self._values if k[0] == datapoint.id]:
+            del self._values[k]
+
+        xcom.setValue(datapoint, command.value, command.dstAddr, command.propertyID)
+
+        # une écriture en flash change aussi la valeur courante
+        self._values[key] = (command.value, now)
+        if command.flash:
+            self._values[(datapoint.id, command.dstAddr, QSP_UNSAVED_VALUE)] = (command.value, now)
+
+        self.written += 1
+        return True
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def __str__(self) -> str:
+        return (f"CommandQueue(pending={len(self)}, received={self.received}, coalesced={self.coalesced}, "
+                f"written={self.written}, skipped={self.skipped})")
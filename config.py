@@ -2,9 +2,67 @@
 SERIAL_DEVICE = "/dev/ttyUSB0"
 BAUDRATE = 115200
 
+# Adresses des unités à lire par type d'appareil, par exemple
+# {"xtender": [101, 102, 103], "variostring": [701, 702], "bsp": [601]}
+# None : recherche automatique des appareils présents au démarrage
+XCOM_DEVICES = None
+
+# Plusieurs passerelles Xcom servies par le même processus, par exemple
+# GATEWAYS = [
+#     {"name": "maison", "type": "rs232", "device": "/dev/ttyUSB0", "baudrate": 115200},
+#     {"name": "atelier", "type": "udp", "host": "192.168.1.20", "srcPort": 4001},
+#     {"name": "chalet", "type": "tcp", "port": 4003, "devices": {"xtender": [101]}},
+# ]
+# Les valeurs de chaque passerelle sont publiées sous home/sensor/<name>/ et
+# son état sous home/sensor/<name>/health. None : SERIAL_DEVICE seul.
+GATEWAYS = None
+
 # Configuration MQTT
 MQTT_BROKER = "localhost"
 MQTT_PORT = 1883
 MQTT_CLIENT_ID = "xcom-sensor-client"
 MQTT_USERNAME = "ha-mqtt"
 MQTT_PASSWORD = "ha-mqtt"
+
+# Nombre maximal de connexions MQTT partagées par toutes les passerelles
+MQTT_POOL_SIZE = 1
+
+# Tampon disque des valeurs non publiées pendant une coupure du broker,
+# republiées dans l'ordre au retour de la connexion (None : désactivé)
+MQTT_BUFFER_DIR = None              # par exemple "/var/lib/xcom-protocol/buffer"
+MQTT_BUFFER_MAX_MB = 64             # taille maximale par passerelle
+MQTT_BUFFER_RETENTION = 7 * 24 * 3600
+MQTT_BUFFER_DROP = "oldest"         # tampon plein : "oldest" (anciennes valeurs) ou "newest"
+
+# Publier un document JSON par groupe d'appareils au lieu d'un topic par valeur
+# (utiliser alors homeassistant/xcom-sensors-json.yaml)
+MQTT_JSON_GROUPS = False
+
+# Publier les valeurs en retained : Home Assistant retrouve immédiatement les
+# dernières valeurs connues après un redémarrage (du broker ou de HA)
+MQTT_RETAIN = True
+
+# Configuration automatique des capteurs par MQTT discovery (ne pas inclure
+# alors les fichiers YAML de homeassistant/)
+MQTT_DISCOVERY = False
+MQTT_DISCOVERY_PREFIX = "homeassistant"
+
+# Appareils et datapoints pris en charge par chaque passerelle, recherchés au
+# démarrage puis toutes les CAPABILITY_REPROBE_INTERVAL secondes (ou sur
+# SIGHUP / --reprobe). Le résultat est conservé dans ce fichier (None : pas de
+# cache, recherche à chaque démarrage).
+CAPABILITY_CACHE = None             # par exemple "/var/lib/xcom-protocol/capabilities.json"
+CAPABILITY_REPROBE_INTERVAL = 24 * 3600
+
+# Écriture des paramètres par MQTT : une valeur publiée sur <topic>set/<paramètre>
+# (par exemple home/sensor/set/max_curr_ac_source) ou sur
+# <topic>set/<type>/<adresse>/<paramètre> (une seule unité) est écrite avant
+# les lectures en attente. Les écritures vont en mémoire vive (perdues au
+# redémarrage de l'onduleur, sans usure de la flash) sauf pour les paramètres
+# listés dans WRITE_FLASH.
+MQTT_COMMANDS = False
+WRITE_FLASH = []                    # par exemple ["BATTERY_CHARGE_CURR", "SOC_LEVEL_FOR_BACKUP"]
+WRITE_PRIORITY = {}                 # plus petite d'abord (0 par défaut), par exemple {"GRID_FEEDING_POWER_LIMIT": -1}
+
+# Port HTTP des métriques Prometheus (http://<hôte>:<port>/metrics), None : désactivé
+METRICS_PORT = None
@@ -0,0 +1,263 @@
+##
+# Tampon disque des valeurs à publier pendant une coupure du broker MQTT
+#
+# Les valeurs sont ajoutées à des fichiers segments de taille fixe, chaque
+# enregistrement porte sa longueur, son CRC et son horodatage : après un
+# arrêt brutal, la fin incomplète du dernier segment est simplement ignorée.
+# La position de relecture est enregistrée dans le fichier "cursor".
+##
+
+import os
+import time
+import zlib
+import logging
+import threading
+
+from struct import Struct
+
+DROP_OLDEST = "oldest"      # tampon plein : supprimer le plus ancien segment
+DROP_NEWEST = "newest"      # tampon plein : refuser les nouvelles valeurs
+
+# longueur, crc32 et horodatage de l'enregistrement
+RECORD_HEADER = Struct("<IId")
+
+def encodeRecord(timestamp: float, topic: str, payload, retain: bool) -> bytes:
+    data = bytes([retain]) + topic.encode() + b"\0" + str(payload).encode()
+    return RECORD_HEADER.pack(len(data), zlib.crc32(data), timestamp) + data
+
+def decodeRecord(data: bytes) -> tuple:
+    """(topic, payload, retain) d'un enregistrement sans l'entête"""
+    topic, _, payload = data[1:].partition(b"\0")
+    return topic.decode(), payload.decode(), bool(data[0])
+
+class DiskBuffer:
+
+    def __init__(self, directory: str, maxBytes=64 * 1024 * 1024, segmentBytes=1024 * 1024,
+            retention=7 * 24 * 3600, dropPolicy=DROP_OLDEST, syncInterval=1.0):
+        """
+        Au plus `maxBytes` sur disque, en segments de `segmentBytes`. Les
+        segments plus anciens que `retention` secondes sont supprimés, les
+        écritures sont synchronisées sur disque toutes les `syncInterval`
+        secondes. Seul le segment en cours d'écriture est ouvert, la mémoire
+        utilisée ne dépend pas de la durée de la coupure.
+        """
+
+        assert dropPolicy in (DROP_OLDEST, DROP_NEWEST), f"unknown drop policy {dropPolicy}"
+
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.segmentBytes = segmentBytes
+        self.retention = retention
+        self.dropPolicy = dropPolicy
+        self.syncInterval = syncInterval
+        self.log = logging.getLogger("DiskBuffer")
+
+        self.appended = 0
+        self.replayed = 0
+        self.dropped = 0
+
+        self._lock = threading.Lock()
+        self._lastSync = time.monotonic()
+
+        os.makedirs(directory, exist_ok=True)
+
+        segments = self._segments()
+        self._readSeq, self._readOffset = self._loadCursor(segments)
+
+        if segments:
+            self._writeSeq = segments[-1]
+            self._writeOffset = self._recover(self._writeSeq)
+        else:
+            self._writeSeq = self._readSeq
+            self._writeOffset = 0
+
+        self._file = open(self._path(self._writeSeq), "ab")
+        self._bytes = sum(os.path.getsize(self._path(seq)) for seq in self._segments())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, error_type, error, traceback) -> bool:
+        self.close()
+        return False
+
+    def close(self):
+        with self._lock:
+            self._sync()
+            self._file.close()
+
+    ## segments
+
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{seq:010d}.seg")
+
+    def _segments(self) -> list[int]:
+        return sorted(int(name[:-4]) for name in os.listdir(self.directory) if name.endswith(".seg"))
+
+    def _records(self, seq: int, offset=0):
+        """(offset suivant, timestamp, données) des enregistrements valides d'un segment"""
+        with open(self._path(seq), "rb") as f:
+            f.seek(offset)
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    return
+
+                length, crc, timestamp = RECORD_HEADER.unpack(header)
+                data = f.read(length)
+                if len(data) < length or zlib.crc32(data) != crc:
+                    self.log.warning(f"corrupted record in segment {seq} at {offset}")
+                    return
+
+                offset += RECORD_HEADER.size + length
+                yield offset, timestamp, data
+
+    def _recover(self, seq: int) -> int:
+        """Tronque le segment après son dernier enregistrement valide"""
+        end = 0
+        for end, _, _ in self._records(seq):
+            pass
+
+        if os.path.getsize(self._path(seq)) != end:
+            self.log.warning(f"truncating segment {seq} to {end} bytes")
+            os.truncate(self._path(seq), end)
+        return end
+
+    def _loadCursor(self, segments: list[int]) -> tuple[int, int]:
+        try:
+            with open(os.path.join(self.directory, "cursor")) as f:
+                seq, offset = (int(v) for v in f.read().split())
+        except (OSError, ValueError):
+            return (segments[0], 0) if segments else (0, 0)
+
+        if segments and seq < segments[0]:
+            return segments[0], 0
+        return seq, offset
+
+    def _saveCursor(self):
+        path = os.path.join(self.directory, "cursor")
+        with open(path + ".tmp", "w") as f:
+            f.write(f"{self._readSeq} {self._readOffset}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._lastSync = time.monotonic()
+
+    def _roll(self):
+        self._sync()
+        self._file.close()
+        self._writeSeq += 1
+        self._writeOffset = 0
+        self._file = open(self._path(self._writeSeq), "ab")
+
+        # rétention, vérifiée à chaque nouveau segment
+        limit = time.time() - self.retention
+        for seq in self._segments():
+            if seq == self._writeSeq or os.path.getmtime(self._path(seq)) >= limit:
+                break
+            self._dropSegment(seq)
+
+    def _dropSegment(self, seq: int):
+        """Supprime un segment, en comptant les enregistrements non relus"""
+        offset = self._readOffset if seq == self._readSeq else 0
+        self.dropped += sum(1 for _ in self._records(seq, offset))
+        self._bytes -= os.path.getsize(self._path(seq))
+        os.remove(self._path(seq))
+
+        if seq == self._readSeq:
+            self._readSeq, self._readOffset = seq + 1, 0
+            self._saveCursor()
+
+    def _enforce(self, incoming: int) -> bool:
+        """Applique la taille maximale, False si l'enregistrement doit être refusé"""
+        while self._bytes + incoming > self.maxBytes:
+            if self.dropPolicy == DROP_NEWEST:
+                self.dropped += 1
+                return False
+
+            oldest = self._segments()[0]
+            if oldest == self._writeSeq:
+                self._roll()
+                continue
+            self._dropSegment(oldest)
+
+        return True
+
+    ## API
+
+    def empty(self) -> bool:
+        return (self._readSeq, self._readOffset) >= (self._writeSeq, self._writeOffset)
+
+    def pendingBytes(self) -> int:
+        """
+        Taille sur disque des enregistrements non relus, entêtes compris
+        (et fin illisible d'un segment corrompu), pas un nombre de valeurs
+        """
+        with self._lock:
+            return self._bytes - self._readOffset
+
+    def append(self, topic: str, payload, retain=False, timestamp: float = None) -> bool:
+        record = encodeRecord(time.time() if timestamp is None else timestamp, topic, payload, retain)
+
+        with self._lock:
+            # _enforce ne pourrait jamais libérer assez de place
+            if len(record) > self.maxBytes:
+                self.dropped += 1
+                return False
+
+            if self._writeOffset >= self.segmentBytes:
+                self._roll()
+            if not self._enforce(len(record)):
+                return False
+
+            self._file.write(record)
+            self._file.flush()
+            self._writeOffset += len(record)
+            self._bytes += len(record)
+            self.appended += 1
+
+            if time.monotonic() - self._lastSync >= self.syncInterval:
+                self._sync()
+
+        return True
+
+    def drain(self, publish, batchSize=100) -> int:
+        """
+        Relit au plus `batchSize` valeurs dans l'ordre d'écriture, appelle
+        publish(timestamp, topic, payload, retain) pour chacune et s'arrête
+        dès qu'elle retourne False. Retourne le nombre de valeurs relues.
+        """
+        count = 0
+
+        with self._lock:
+            self._file.flush()
+
+            while count < batchSize and not self.empty():
+                for offset, timestamp, data in self._records(self._readSeq, self._readOffset):
+                    if not publish(timestamp, *decodeRecord(data)):
+                        self._saveCursor()
+                        return count
+
+                    self._readOffset = offset
+                    count += 1
+                    if count >= batchSize:
+                        break
+                else:
+                    # fin du segment : passer au suivant
+                    if self._readSeq == self._writeSeq:
+                        break
+                    self._bytes -= os.path.getsize(self._path(self._readSeq))
+                    os.remove(self._path(self._readSeq))
+                    self._readSeq, self._readOffset = self._readSeq + 1, 0
+
+            self.replayed += count
+            self._saveCursor()
+
+        return count
+
+    def __str__(self) -> str:
+        return f"DiskBuffer(appended={self.appended}, replayed={self.replayed}, dropped={self.dropped})"
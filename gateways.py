@@ -0,0 +1,497 @@
+##
+# Pont MQTT pour plusieurs passerelles Xcom : chaque passerelle (RS232,
+# LAN-UDP ou LAN-TCP) est lue par son propre thread, les publications passent
+# par un pool de connexions MQTT partagé
+##
+
+import os
+import json
+import time
+import threading
+
+import paho.mqtt.client as mqtt
+
+from xcom_proto import XcomRS232, XcomLANTCP, XcomLANUDP
+from xcom_proto import PollScheduler
+from polling_profile import POLLING_PROFILE, TOPIC, deviceProfile, withTopic
+from publishing import ChangeFilter, GroupPublisher
+from ha_config import discoveryMessages
+from diskbuffer import DiskBuffer
+from capabilities import CapabilityCache, probe, supportedProfile
+from commands import CommandQueue, parseCommand, parseValue
+import metrics
+
+HEALTH_INTERVAL = 30        # secondes entre deux publications de l'état d'une passerelle
+STATS_INTERVAL = 60         # secondes entre deux affichages des statistiques de lecture
+RECONNECT_DELAY = 5         # délai initial avant de rouvrir une passerelle en erreur
+MAX_RECONNECT_DELAY = 300
+BUFFER_BATCH = 500          # valeurs du tampon disque republiées par cycle
+PROBE_INTERVAL = 24 * 3600  # secondes entre deux recherches des datapoints pris en charge
+
+def openXcom(spec: dict):
+    """Crée la connexion Xcom décrite par une entrée de config.GATEWAYS"""
+    kind = spec.get("type", "rs232")
+
+    if kind == "rs232":
+        return XcomRS232(serialDevice=spec["device"], baudrate=spec.get("baudrate", 115200))
+    elif kind == "udp":
+        return XcomLANUDP(spec["host"], dstPort=spec.get("dstPort", 4002), srcPort=spec.get("srcPort", 4001))
+    elif kind == "tcp":
+        return XcomLANTCP(port=spec.get("port", 4001))
+
+    raise ValueError(f"type de passerelle inconnu : {kind}")
+
+def gatewayKey(spec: dict) -> str:
+    """Identifie une passerelle dans le cache des capacités"""
+    kind = spec.get("type", "rs232")
+
+    if kind == "rs232":
+        return f"rs232:{spec['device']}"
+    elif kind == "udp":
+        return f"udp:{spec['host']}:{spec.get('dstPort', 4002)}"
+    return f"{kind}:{spec.get('port', 4001)}"
+
+def gatewaySpecs(config) -> list[dict]:
+    """config.GATEWAYS, ou la passerelle série unique des anciennes configurations"""
+    specs = getattr(config, "GATEWAYS", None)
+    if specs:
+        return specs
+
+    return [{
+        "type": "rs232",
+        "device": config.SERIAL_DEVICE,
+        "baudrate": config.BAUDRATE,
+        "devices": getattr(config, "XCOM_DEVICES", None),
+    }]
+
+class MqttPool:
+    """
+    Connexions MQTT partagées par les passerelles : `size` clients au plus,
+    attribués à tour de rôle, quel que soit le nombre de passerelles
+    """
+
+    def __init__(self, config, size=1, on_connect=None, on_publish=None):
+        self.clients: list[mqtt.Client] = list()
+        self._listeners: dict[mqtt.Client, list] = dict()
+        self._on_connect = on_connect
+        self._config = config
+
+        for i in range(max(1, size)):
+            clientID = config.MQTT_CLIENT_ID if size <= 1 else f"{config.MQTT_CLIENT_ID}-{i}"
+            client = mqtt.Client(clientID)
+            client.username_pw_set(config.MQTT_USERNAME, config.MQTT_PASSWORD)
+            client.on_connect = self._onConnect
+            client.on_publish = on_publish
+
+            self.clients.append(client)
+            self._listeners[client] = list()
+
+            # paquets en attente d'envoi dans le client paho
+            metrics.PUBLISH_QUEUE.setFunction(clientID, function=lambda c=client: len(getattr(c, "_out_packet", ())))
+
+    def attach(self, index: int, listener) -> mqtt.Client:
+        """Client utilisé par la passerelle `index`, listener() est appelé à chaque (re)connexion"""
+        client = self.clients[index % len(self.clients)]
+        self._listeners[client].append(listener)
+        return client
+
+    def _onConnect(self, client, userdata, flags, rc):
+        if self._on_connect is not None:
+            self._on_connect(client, userdata, flags, rc)
+        if rc != 0:
+            return
+
+        for listener in self._listeners[client]:
+            listener()
+
+    def connect(self):
+        print(f"Tentative de connexion au broker MQTT {self._config.MQTT_BROKER}:{self._config.MQTT_PORT}")
+        for client in self.clients:
+            client.connect(self._config.MQTT_BROKER, self._config.MQTT_PORT)
+            client.loop_start()
+        print(f"Connexion MQTT initialisée ({len(self.clients)} client(s)).")
+
+    def stop(self):
+        for client in self.clients:
+            client.loop_stop()
+            client.disconnect()
+
+class Gateway:
+    """
+    Une passerelle Xcom lue par son propre thread : ouverture (et réouverture
+    après une erreur), recherche des appareils, polling et publication
+    """
+
+    def __init__(self, index: int, spec: dict, config, pool: MqttPool):
+        self.spec = spec
+        self.name = spec.get("name")
+        self.config = config
+
+        # sans nom (une seule passerelle), les topics historiques sont conservés
+        self.topic = spec.get("topic") or (TOPIC + f"{self.name}/" if self.name else TOPIC)
+        self.jsonGroups = getattr(config, "MQTT_JSON_GROUPS", False)
+        self.retain = getattr(config, "MQTT_RETAIN", True)
+
+        self._resync = threading.Event()
+        self._stop = threading.Event()
+        self._reprobe = threading.Event()
+        self._wakeup = threading.Event()
+        self._probed = 0
+        self._lastHealth = 0
+        self._lastStats = 0
+        self._valuesRead = 0
+
+        self.client = pool.attach(index, self._onConnect)
+        self.changeFilter = ChangeFilter()
+        self.groups = GroupPublisher(self.topic) if self.jsonGroups else None
+
+        # valeurs conservées sur disque pendant une coupure du broker
+        self.buffer = None
+        self.stale = 0
+        # topic -> instant de la dernière publication directe (hors tampon)
+        self._published: dict[str, float] = dict()
+        bufferDir = getattr(config, "MQTT_BUFFER_DIR", None)
+        if bufferDir:
+            self.buffer = DiskBuffer(
+                os.path.join(bufferDir, self.name or "xcom"),
+                maxBytes=getattr(config, "MQTT_BUFFER_MAX_MB", 64) * 1024 * 1024,
+                retention=getattr(config, "MQTT_BUFFER_RETENTION", 7 * 24 * 3600),
+                dropPolicy=getattr(config, "MQTT_BUFFER_DROP", "oldest"))
+            metrics.BUFFER_PENDING.setFunction(str(self), function=self.buffer.pendingBytes)
+
+        # appareils et datapoints pris en charge, conservés entre deux lancements
+        self.capabilities = None
+        self.probeInterval = getattr(config, "CAPABILITY_REPROBE_INTERVAL", PROBE_INTERVAL)
+        if getattr(config, "CAPABILITY_CACHE", None):
+            self.capabilities = CapabilityCache(os.path.expanduser(config.CAPABILITY_CACHE), self.probeInterval)
+
+        # écritures reçues sur <topic>set/..., faites avant les lectures
+        self.commands = None
+        if getattr(config, "MQTT_COMMANDS", False):
+            self.commands = CommandQueue(getattr(config, "WRITE_FLASH", ()), getattr(config, "WRITE_PRIORITY", None))
+            self.client.message_callback_add(self.topic + "set/#", self._onCommand)
+
+        self.xcom = None
+        self.transport = None
+        self.profile = None
+        self.scheduler = None
+        self.state = "stopped"
+        self.reads = 0
+        self.errors = 0
+        self.lastRead = None
+        self.lastError = None
+        self._retransmissions = 0
+
+        self._thread = threading.Thread(target=self.run, name=f"gateway-{self.name or 'xcom'}", daemon=True)
+
+    def __str__(self) -> str:
+        return self.name or self.spec.get("device") or self.spec.get("host") or "xcom"
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        # the scheduler waits for _wakeup only, see PollScheduler.run
+        self._wakeup.set()
+        self._thread.join(timeout)
+
+    def reprobe(self):
+        """Recherche à nouveau les datapoints pris en charge, au prochain cycle"""
+        self._reprobe.set()
+
+    def health(self) -> dict:
+        return {
+            "state": self.state,
+            "reads": self.reads,
+            "errors": self.errors,
+            "last_read": None if self.lastRead is None else round(time.time() - self.lastRead, 1),
+            "last_error": self.lastError,
+            "buffered": 0 if self.buffer is None else self.buffer.pendingBytes(),
+            "dropped": 0 if self.buffer is None else self.buffer.dropped,
+            "stale": self.stale,
+            "circuit": None if self.xcom is None else self.xcom.breaker.state,
+            "pending_writes": 0 if self.commands is None else len(self.commands),
+        }
+
+    def run(self):
+        delay = RECONNECT_DELAY
+
+        while not self._stop.is_set():
+            self.state = "connecting"
+            try:
+                with openXcom(self.spec) as xcom:
+                    self.xcom = xcom
+                    self._poll()
+                delay = RECONNECT_DELAY
+            except Exception as e:
+                self.state = "error"
+                self.errors += 1
+                self.lastError = str(e)
+                print(f"[{self}] Erreur lors de la communication avec le périphérique Xcom: {e}")
+                self._publishHealth(force=True)
+
+                # nouvelle tentative avec un délai croissant
+                self._stop.wait(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+            finally:
+                self.xcom = None
+
+        self.state = "stopped"
+        self._publishHealth(force=True)
+        if self.buffer is not None:
+            self.buffer.close()
+
+    def _poll(self):
+        print(f"[{self}] Connexion initialisée.")
+
+        self.profile = self._probe(force=self._reprobe.is_set())
+        self._reprobe.clear()
+
+        self.state = "running"
+        self._resync.set()
+
+        # plusieurs requêtes en vol sur UDP
+        readMany = self._readMany if isinstance(self.xcom, XcomLANUDP) else None
+
+        self.transport = type(self.xcom).__name__
+        self._retransmissions = self.xcom.retransmission.retransmissions
+        metrics.REQUEST_TIMEOUT.setFunction(str(self), self.transport,
+            function=lambda t=self.xcom.retransmission: t.rto)
+        self.scheduler = PollScheduler(self.profile)
+        self.scheduler.run(self._read, self._onValue, self._onError, self._onSlot, readMany, self._stop,
+            self._write, self._wakeup)
+
+    def _probe(self, force=False) -> list:
+        """Profil de polling limité aux appareils présents et aux datapoints qui répondent"""
+        key = gatewayKey(self.spec)
+        configured = self.spec.get("devices")
+
+        capabilities = None
+        if self.capabilities is not None and not force:
+            capabilities = self.capabilities.get(key)
+            # appareils modifiés dans la configuration depuis la recherche
+            if capabilities is not None and configured is not None and capabilities["devices"] != configured:
+                capabilities = None
+
+        if capabilities is not None:
+            print(f"[{self}] Capacités lues depuis le cache ({len(capabilities['unsupported'])} datapoints non pris en charge)")
+            self.xcom.devices = capabilities["devices"]
+        else:
+            # Unités présentes sur le bus : configurées ou recherchées
+            devices = configured
+            if devices is None:
+                devices = self.xcom.scanDevices()
+                print(f"[{self}] Appareils trouvés : {devices}")
+            # unités lues une par une quand un datapoint refuse la lecture multicast
+            self.xcom.devices = devices
+
+            if any(devices.values()):
+                capabilities = probe(self.xcom, devices, self._deviceProfile(devices))
+                print(f"[{self}] Datapoints non pris en charge : {capabilities['unsupported']}")
+                if self.capabilities is not None:
+                    self.capabilities.put(key, capabilities)
+            else:
+                # aucune réponse, tout est lu et la recherche refaite au prochain intervalle
+                capabilities = {"probed": time.time(), "devices": devices, "unsupported": []}
+
+        self._probed = capabilities["probed"]
+        profile = self._deviceProfile(capabilities["devices"])
+        # rien ne répond : tout lire plutôt que de ne rien planifier
+        return supportedProfile(profile, capabilities) or profile
+
+    def _deviceProfile(self, devices: dict) -> list:
+        profile = deviceProfile(devices) or POLLING_PROFILE
+        return withTopic(self.topic, profile) if self.topic != TOPIC else profile
+
+    def _read(self, entry):
+        # une écriture reçue pendant le cycle passe avant les lectures restantes
+        self._write()
+
+        start = time.monotonic()
+        metrics.SCHEDULE_LAG.observe(str(self), value=max(0.0, start - entry.nextDue))
+
+        try:
+            return self.xcom.getValue(entry.datapoint, entry.dstAddr)
+        finally:
+            metrics.REQUEST_DURATION.observe(str(self), self.transport, entry.datapoint.name,
+                value=time.monotonic() - start)
+
+    def _readMany(self, batch) -> list:
+        self._write()
+
+        start = time.monotonic()
+        for entry in batch:
+            metrics.SCHEDULE_LAG.observe(str(self), value=max(0.0, start - entry.nextDue))
+
+        values = self.xcom.getValuesFrom([(e.datapoint, e.dstAddr) for e in batch], return_exceptions=True)
+
+        # les lectures se recouvrent, chacune compte pour sa part de la durée totale
+        duration = (time.monotonic() - start) / max(1, len(batch))
+        for entry in batch:
+            metrics.REQUEST_DURATION.observe(str(self), self.transport, entry.datapoint.name, value=duration)
+        return values
+
+    def _onValue(self, entry, value):
+        self.reads += 1
+        self.lastRead = time.time()
+
+        value = entry.convert(value)
+        if not self.changeFilter.shouldPublish(entry.topic, value, entry.rule):
+            metrics.SUPPRESSED.inc(str(self))
+            return
+        metrics.PUBLISHED.inc(str(self))
+
+        if self.groups is not None:
+            self.groups.update(entry, value)
+        else:
+            self._publish(entry.topic, value)
+
+    def _publish(self, topic: str, payload):
+        """Publie une valeur, ou la garde dans le tampon disque si le broker est injoignable"""
+        if self.buffer is None:
+            self.client.publish(topic, payload, retain=self.retain)
+            return
+
+        # tant que le tampon n'est pas vide, les valeurs y sont ajoutées pour garder l'ordre
+        if self.buffer.empty() and self.client.is_connected():
+            if self.client.publish(topic, payload, retain=self.retain).rc == mqtt.MQTT_ERR_SUCCESS:
+                self._published[topic] = time.time()
+                return
+
+        self.buffer.append(topic, payload, self.retain)
+
+    def _replay(self, timestamp, topic, payload, retain) -> bool:
+        """
+        Republie une valeur du tampon. Une valeur plus ancienne que la
+        dernière publiée directement sur son topic est abandonnée : elle
+        remplacerait une valeur plus récente (retain) chez les abonnés.
+        """
+        if timestamp < self._published.get(topic, 0):
+            self.stale += 1
+            return True
+
+        if not self.client.is_connected():
+            return False
+        return self.client.publish(topic, payload, retain=retain).rc == mqtt.MQTT_ERR_SUCCESS
+
+    def _onError(self, entry, e):
+        self.errors += 1
+        self.lastError = f"{entry.datapoint.name}: {e}"
+
+        error = metrics.errorName(e)
+        metrics.REQUEST_ERRORS.inc(str(self), self.transport, error)
+        if error in metrics.TIMEOUT_ERRORS:
+            metrics.REQUEST_TIMEOUTS.inc(str(self), self.transport)
+        print(f"[{self}] Erreur lors de la lecture de {entry.datapoint.name} : {e}")
+
+    def _onConnect(self):
+        self._resync.set()
+        if self.commands is not None:
+            self.client.subscribe(self.topic + "set/#")
+
+    def _onCommand(self, client, userdata, message):
+        """Thread MQTT : met l'écriture en file et réveille la passerelle"""
+        path = message.topic[len(self.topic + "set/"):]
+        try:
+            datapoint, dstAddr = parseCommand(path)
+            value = parseValue(datapoint, message.payload)
+            self.commands.check(datapoint, dstAddr, value)
+        except (TypeError, ValueError) as e:
+            metrics.WRITES.inc(str(self), "INVALID")
+            print(f"[{self}] Commande ignorée sur {message.topic} : {e}")
+            return
+
+        if not self.commands.put(datapoint, dstAddr, value, self.topic + path):
+            metrics.WRITES.inc(str(self), "COALESCED")
+        self._wakeup.set()
+
+    def _write(self):
+        """Écritures en attente"""
+        if not self.commands:
+            return
+
+        while (command := self.commands.take()) is not None:
+            try:
+                written = self.commands.execute(self.xcom, command)
+            except Exception as e:
+                self.errors += 1
+                self.lastError = f"{command.datapoint.name}: {e}"
+                # valeur hors des limites lues sur l'appareil
+                metrics.WRITES.inc(str(self), "INVALID" if isinstance(e, ValueError) else metrics.errorName(e))
+                print(f"[{self}] Erreur lors de l'écriture de {command.datapoint.name} : {e}")
+                continue
+
+            metrics.WRITES.inc(str(self), "WRITTEN" if written else "UNCHANGED")
+            metrics.WRITE_LATENCY.observe(str(self), value=time.monotonic() - command.received)
+            print(f"[{self}] {command.datapoint.name}@{command.dstAddr} = {command.value} "
+                + ("écrit" + (" en flash" if command.flash else "") if written else "inchangé"))
+
+            # valeur actuelle du paramètre, pour l'état des entités
+            self._publish(command.topic, command.value)
+
+    def _onSlot(self, batch):
+        if self._reprobe.is_set() or time.time() - self._probed >= self.probeInterval:
+            self._reprobe.clear()
+            self.profile = self._probe(force=True)
+            self.scheduler.setEntries(self.profile)
+            self._resync.set()
+
+        if self._resync.is_set():
+            self._resync.clear()
+            self._publishDiscovery()
+            # après une (re)connexion, republier toutes les valeurs
+            self.changeFilter.forget()
+
+        if self.buffer is not None and not self.buffer.empty() and self.client.is_connected():
+            self.buffer.drain(self._replay, BUFFER_BATCH)
+
+        if self.groups is not None:
+            self.groups.flush(self._publish)
+
+        metrics.CYCLE_DURATION.observe(str(self), value=self.scheduler.lastStepDuration)
+
+        # requêtes renvoyées faute de réponse depuis le dernier créneau
+        retransmission = self.xcom.retransmission
+        if retransmission.retransmissions > self._retransmissions:
+            metrics.REQUEST_RETRIES.inc(str(self), self.transport,
+                amount=retransmission.retransmissions - self._retransmissions)
+        self._retransmissions = retransmission.retransmissions
+
+        self._valuesRead += len(batch)
+        self._printStats()
+        self._publishHealth()
+
+    def _printStats(self):
+        # un créneau par seconde avec le niveau rapide, afficher un résumé
+        # toutes les STATS_INTERVAL secondes seulement
+        now = time.monotonic()
+        if now - self._lastStats < STATS_INTERVAL:
+            return
+        self._lastStats = now
+
+        stats = getattr(self.xcom, "stats", None)
+        print(f"[{self}] {self._valuesRead} valeurs lues. {self.changeFilter}, session : {stats}, {self.xcom.requestCache}"
+            + f", {self.xcom.retransmission}, {self.xcom.breaker}"
+            + (f", {self.commands}" if self.commands is not None else "")
+            + (f", {self.buffer}" if self.buffer is not None else ""))
+        self._valuesRead = 0
+        if stats is not None:
+            stats.reset()
+
+    def _publishDiscovery(self):
+        # configuration des capteurs par MQTT discovery (retained)
+        if not getattr(self.config, "MQTT_DISCOVERY", False):
+            return
+
+        prefix = getattr(self.config, "MQTT_DISCOVERY_PREFIX", "homeassistant")
+        for topic, payload in discoveryMessages(self.profile, self.jsonGroups, prefix, self.topic, self.name):
+            self.client.publish(topic, payload, retain=True)
+
+    def _publishHealth(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._lastHealth < HEALTH_INTERVAL:
+            return
+
+        self._lastHealth = now
+        self.client.publish(self.topic + "health", json.dumps(self.health(), separators=(",", ":")), retain=True)
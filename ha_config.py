@@ -0,0 +1,144 @@
+##
+# Génération de la configuration des capteurs MQTT de Home Assistant à partir
+# du profil de polling et des métadonnées du Dataset, sous forme de YAML ou de
+# messages MQTT discovery
+#
+# usage: python ha_config.py [--json] > homeassistant/xcom-sensors-json.yaml
+##
+
+import argparse
+import json
+
+from polling_profile import POLLING_PROFILE, TOPIC
+from publishing import GroupPublisher
+
+DEVICE_CLASSES = {
+    "W": "power",
+    "kW": "power",
+    "Wh": "energy",
+    "kWh": "energy",
+    "MWh": "energy",
+    "V": "voltage",
+    "A": "current",
+    "Hz": "frequency",
+    "°C": "temperature",
+    "h": "duration",
+}
+
+DEVICE_NAMES = {
+    "xtender": "Xtender",
+    "bsp": "BSP",
+    "variotrack": "VarioTrack",
+    "variostring": "VarioString",
+}
+
+ACRONYMS = {
+    "ac": "AC",
+    "pv": "PV",
+    "vs": "VS",
+    "soc": "SOC",
+    "24h": "24h",
+    "batt": "Battery",
+    "freq": "Frequency",
+    "curr": "Current",
+    "prev": "Previous",
+    "num": "Number Of",
+    "temp": "Temperature",
+}
+
+def sensorName(entry) -> str:
+    words = GroupPublisher.keyOf(entry).split("_")
+    name = " ".join(ACRONYMS.get(w, w.capitalize()) for w in words)
+
+    # valeur d'une unité particulière
+    group = GroupPublisher.groupOf(entry)
+    if "/" in group:
+        deviceType, addr = group.split("/")
+        name += f" ({DEVICE_NAMES.get(deviceType, deviceType)} {addr})"
+
+    return name
+
+def sensorUnit(entry) -> str:
+    unit = entry.datapoint.unit
+    # les valeurs multipliées par 1000 sont publiées sans le préfixe kilo
+    if entry.scale == 1000 and unit.startswith("k"):
+        return unit[1:]
+    return unit
+
+def sensorConfig(entry, jsonGroups=False, topic=TOPIC) -> dict:
+    """Définition d'un capteur MQTT de Home Assistant pour une entrée du profil"""
+    key = GroupPublisher.keyOf(entry)
+    config = {"name": sensorName(entry)}
+
+    if jsonGroups:
+        config["state_topic"] = GroupPublisher(topic).topicOf(GroupPublisher.groupOf(entry))
+        config["value_template"] = "{{ value_json.%s }}" % key
+    else:
+        config["state_topic"] = entry.topic
+
+    unit = sensorUnit(entry)
+    if unit:
+        config["unit_of_measurement"] = unit
+    if unit in DEVICE_CLASSES:
+        config["device_class"] = DEVICE_CLASSES[unit]
+    if unit == "%" and "soc" in key:
+        config["device_class"] = "battery"
+
+    return config
+
+def discoveryMessages(profile=POLLING_PROFILE, jsonGroups=False, prefix="homeassistant",
+        topic=TOPIC, site: str = None) -> list[tuple[str, str]]:
+    """
+    (topic, payload) des configurations MQTT discovery, à publier en retained.
+    Avec plusieurs passerelles, `site` (le nom de la passerelle) distingue
+    les appareils et capteurs de chaque installation.
+    """
+    messages = list()
+
+    for entry in profile:
+        key = GroupPublisher.keyOf(entry)
+        group = GroupPublisher.groupOf(entry)
+        deviceType, _, addr = group.partition("/")
+
+        # une unité particulière est un appareil distinct dans Home Assistant
+        node = "xcom_" + (f"{site}_" if site else "") + group.replace("/", "_")
+        objectId = f"xcom_{key}" if not addr and not site else f"{node}_{key}"
+        model = DEVICE_NAMES.get(deviceType, deviceType)
+
+        config = sensorConfig(entry, jsonGroups, topic)
+        config["unique_id"] = objectId
+        config["object_id"] = objectId
+        config["device"] = {
+            "identifiers": [node],
+            "name": f"Studer {model} {addr}".rstrip() + (f" ({site})" if site else ""),
+            "manufacturer": "Studer Innotec",
+            "model": model,
+        }
+
+        messages.append((f"{prefix}/sensor/{node}/{key}/config", json.dumps(config, separators=(",", ":"))))
+
+    return messages
+
+def generateYaml(profile=POLLING_PROFILE, jsonGroups=False, topic=TOPIC) -> str:
+    lines = ["mqtt:", "  sensor:"]
+
+    groups: dict[str, list] = dict()
+    for entry in profile:
+        groups.setdefault(GroupPublisher.groupOf(entry), list()).append(entry)
+
+    for group, entries in groups.items():
+        lines.append(f"    # {group}")
+
+        for entry in entries:
+            for i, (key, value) in enumerate(sensorConfig(entry, jsonGroups, topic).items()):
+                prefix = "    - " if i == 0 else "      "
+                lines.append(f'{prefix}{key}: "{value}"')
+
+    return "\n".join(lines) + "\n"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Génère la configuration des capteurs Home Assistant")
+    parser.add_argument("--json", action="store_true", help="capteurs pour le mode MQTT_JSON_GROUPS")
+    args = parser.parse_args()
+
+    print(generateYaml(jsonGroups=args.json), end="")
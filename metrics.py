@@ -0,0 +1,212 @@
+##
+# Métriques Prometheus / OpenMetrics du pont, exposées en HTTP sur /metrics
+# quand METRICS_PORT est configuré. Sans dépendance : les compteurs,
+# histogrammes et jauges nécessaires sont implémentés ici.
+##
+
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from xcom_proto import CircuitOpenError
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+CYCLE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def formatLabels(names: tuple, values: tuple, extra: str = "") -> str:
+    labels = [f'{n}="{escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+class Metric:
+
+    type = "unknown"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def render(self) -> list[str]:
+        return [f"# TYPE {self.name} {self.type}", f"# HELP {self.name} {self.help}"] + self.samples()
+
+    def samples(self) -> list[str]:
+        return []
+
+class Counter(Metric):
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        super().__init__(name, help, labels)
+        self._values: dict[tuple, float] = dict()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            return [f"{self.name}_total{formatLabels(self.labels, k)} {v}" for k, v in self._values.items()]
+
+class Gauge(Metric):
+    """Valeur fixée par set(), ou calculée à chaque lecture par la fonction de setFunction()"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        super().__init__(name, help, labels)
+        self._values: dict[tuple, object] = dict()
+
+    def set(self, *labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+    def setFunction(self, *labels, function):
+        self.set(*labels, value=function)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+
+        samples = list()
+        for k, v in values:
+            try:
+                v = v() if callable(v) else v
+            except Exception:
+                continue
+            samples.append(f"{self.name}{formatLabels(self.labels, k)} {v}")
+        return samples
+
+class Histogram(Metric):
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # labels -> [compte par intervalle..., somme, nombre]
+        self._values: dict[tuple, list] = dict()
+
+    def observe(self, *labels, value: float):
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * (len(self.buckets) + 2)
+
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-2] += value
+            counts[-1] += 1
+
+    def samples(self) -> list[str]:
+        samples = list()
+        with self._lock:
+            for k, counts in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    le = formatLabels(self.labels, k, 'le="%s"' % bound)
+                    samples.append(f"{self.name}_bucket{le} {cumulative}")
+                le = formatLabels(self.labels, k, 'le="+Inf"')
+                samples.append(f"{self.name}_bucket{le} {counts[-1]}")
+                samples.append(f"{self.name}_sum{formatLabels(self.labels, k)} {counts[-2]}")
+                samples.append(f"{self.name}_count{formatLabels(self.labels, k)} {counts[-1]}")
+        return samples
+
+class Registry:
+
+    def __init__(self):
+        self.metrics: list[Metric] = list()
+
+    def add(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = list()
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+## métriques du pont
+
+REQUEST_DURATION = REGISTRY.add(Histogram("xcom_request_duration_seconds",
+    "Durée d'une lecture Xcom", ("gateway", "transport", "datapoint")))
+REQUEST_TIMEOUTS = REGISTRY.add(Counter("xcom_request_timeouts",
+    "Lectures Xcom sans réponse", ("gateway", "transport")))
+REQUEST_RETRIES = REGISTRY.add(Counter("xcom_request_retries",
+    "Requêtes Xcom renvoyées", ("gateway", "transport")))
+REQUEST_TIMEOUT = REGISTRY.add(Gauge("xcom_request_timeout_seconds",
+    "Timeout courant d'une requête, estimé d'après le temps aller-retour", ("gateway", "transport")))
+REQUEST_ERRORS = REGISTRY.add(Counter("xcom_request_errors",
+    "Erreurs de lecture Xcom, par code d'erreur", ("gateway", "transport", "error")))
+CYCLE_DURATION = REGISTRY.add(Histogram("xcom_cycle_duration_seconds",
+    "Durée des lectures d'un cycle de polling", ("gateway",), CYCLE_BUCKETS))
+SCHEDULE_LAG = REGISTRY.add(Histogram("xcom_schedule_lag_seconds",
+    "Retard d'une lecture sur son échéance", ("gateway",), CYCLE_BUCKETS))
+PUBLISHED = REGISTRY.add(Counter("mqtt_published",
+    "Valeurs publiées sur MQTT", ("gateway",)))
+SUPPRESSED = REGISTRY.add(Counter("mqtt_suppressed",
+    "Valeurs non publiées (inchangées ou dans la bande morte)", ("gateway",)))
+PUBLISH_QUEUE = REGISTRY.add(Gauge("mqtt_publish_queue_depth",
+    "Messages en attente d'envoi dans le client MQTT", ("client",)))
+BUFFER_PENDING = REGISTRY.add(Gauge("mqtt_buffer_pending_bytes",
+    "Octets des valeurs non republiées dans le tampon disque, entêtes compris", ("gateway",)))
+WRITES = REGISTRY.add(Counter("xcom_writes",
+    "Commandes d'écriture reçues par MQTT, par résultat", ("gateway", "result")))
+WRITE_LATENCY = REGISTRY.add(Histogram("xcom_write_latency_seconds",
+    "Délai entre la réception d'une commande et son écriture", ("gateway",)))
+
+# erreurs comptées comme des requêtes sans réponse
+TIMEOUT_ERRORS = ("TIMEOUT", "RESPONSE_TIMEOUT")
+
+def errorName(e: Exception) -> str:
+    """Nom de l'erreur Xcom (ERROR_CODES) d'une exception de lecture"""
+    if isinstance(e, KeyError) and len(e.args) == 2 and e.args[0] == "Error received":
+        return e.args[1]
+    if isinstance(e, TimeoutError):
+        return "TIMEOUT"
+    if isinstance(e, CircuitOpenError):
+        # passerelle considérée hors ligne, rien n'a été envoyé
+        return "CIRCUIT_OPEN"
+    if type(e).__module__ != "builtins":
+        return f"{type(e).__module__}.{type(e).__name__}"
+    return type(e).__name__
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def startServer(port: int, host: str = "") -> ThreadingHTTPServer:
+    """Sert /metrics dans un thread en arrière-plan"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"Métriques disponibles sur http://{host or '0.0.0.0'}:{port}/metrics")
+    return server
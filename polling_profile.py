@@ -0,0 +1,150 @@
+##
+# Profil de polling : intervalle, priorité et topic MQTT de chaque datapoint
+#
+# Les puissances et courants sont lus chaque seconde, les tensions et états
+# toutes les 10 secondes, les compteurs journaliers chaque minute et les
+# historiques / totaux tous les quarts d'heure.
+#
+# Avec plusieurs unités d'un même type (Xtender triphasés, plusieurs
+# VarioString, ...), deviceProfile() ajoute la lecture de chaque unité sur
+# home/sensor/<type>/<adresse>/<clé>, en plus des valeurs agrégées.
+##
+
+from dataclasses import replace
+
+from xcom_proto import XcomP as param
+from xcom_proto import PollEntry
+from xcom_proto.parameters import getDeviceType
+from publishing import PublishRule, EXACT
+
+TOPIC = "home/sensor/"
+
+FAST    = dict(interval=1, priority=0)      # puissance, courant
+NORMAL  = dict(interval=10, priority=1)     # tension, fréquence, états
+SLOW    = dict(interval=60, priority=2)     # compteurs du jour
+HISTORY = dict(interval=900, priority=3)    # jour précédent, totaux, historiques
+
+# bandes mortes de publication, les compteurs, états et énumérations
+# utilisent EXACT (publiés à chaque changement)
+POWER_W     = PublishRule(absolute=10, relative=0.02)
+POWER_KW    = PublishRule(absolute=0.01, relative=0.02)
+CURRENT     = PublishRule(absolute=0.1, relative=0.02)
+VOLTAGE     = PublishRule(absolute=0.2)
+FREQUENCY   = PublishRule(absolute=0.05)
+TEMPERATURE = PublishRule(absolute=0.5)
+PERCENT     = PublishRule(absolute=0.5)
+
+POLLING_PROFILE = [
+    # AC
+    PollEntry(param.AC_POWER_OUT, topic=TOPIC + "ac_power_out", scale=1000, rule=POWER_W, **FAST),
+    PollEntry(param.AC_POWER_IN, topic=TOPIC + "ac_power_in", scale=1000, rule=POWER_W, **FAST),
+    PollEntry(param.AC_ENERGY_IN_CURR_DAY, topic=TOPIC + "ac_energy_in_curr_day", scale=1000, rule=EXACT, **SLOW),
+    PollEntry(param.AC_ENERGY_IN_PREV_DAY, topic=TOPIC + "ac_energy_in_prev_day", scale=1000, rule=EXACT, **HISTORY),
+    PollEntry(param.AC_ENERGY_OUT_CURR_DAY, topic=TOPIC + "ac_energy_out_curr_day", scale=1000, rule=EXACT, **SLOW),
+    PollEntry(param.AC_ENERGY_OUT_PREV_DAY, topic=TOPIC + "ac_energy_out_prev_day", scale=1000, rule=EXACT, **HISTORY),
+    PollEntry(param.AC_FREQ_IN, topic=TOPIC + "ac_freq_in", rule=FREQUENCY, **NORMAL),
+    PollEntry(param.AC_FREQ_OUT, topic=TOPIC + "ac_freq_out", rule=FREQUENCY, **NORMAL),
+    PollEntry(param.AC_VOLTAGE_IN, topic=TOPIC + "ac_voltage_in", rule=VOLTAGE, **NORMAL),
+    PollEntry(param.AC_VOLTAGE_OUT, topic=TOPIC + "ac_voltage_out", rule=VOLTAGE, **NORMAL),
+    PollEntry(param.AC_CURRENT_IN, topic=TOPIC + "ac_current_in", rule=CURRENT, **FAST),
+    PollEntry(param.AC_CURRENT_OUT, topic=TOPIC + "ac_current_out", rule=CURRENT, **FAST),
+    PollEntry(param.ENERGY_AC_IN_TOTAL, topic=TOPIC + "energy_ac_in_total", rule=EXACT, **HISTORY),
+    PollEntry(param.ENERGY_AC_OUT_TOTAL, topic=TOPIC + "energy_ac_out_total", rule=EXACT, **HISTORY),
+
+    # État du système
+    PollEntry(param.SYSTEM_STATE, topic=TOPIC + "system_state", rule=EXACT, **NORMAL),
+    PollEntry(param.OPERATING_MODE, topic=TOPIC + "operating_mode", rule=EXACT, **NORMAL),
+    PollEntry(param.INPUT_ACTIVE, topic=TOPIC + "input_active", rule=EXACT, **NORMAL),
+    PollEntry(param.TRANSFER_RELAY_STATE, topic=TOPIC + "transfer_relay_state", rule=EXACT, **NORMAL),
+    PollEntry(param.GRID_FEEDING_ACTIVE, topic=TOPIC + "grid_feeding_active", rule=EXACT, **NORMAL),
+    PollEntry(param.AUXILIARY_RELAY_1_STATE, topic=TOPIC + "auxiliary_relay_1_state", rule=EXACT, **NORMAL),
+    PollEntry(param.AUXILIARY_RELAY_2_STATE, topic=TOPIC + "auxiliary_relay_2_state", rule=EXACT, **NORMAL),
+    PollEntry(param.RUNNING_TIME, topic=TOPIC + "running_time", rule=EXACT, **SLOW),
+
+    # Batterie
+    PollEntry(param.BATT_VOLTAGE, topic=TOPIC + "batt_voltage", rule=VOLTAGE, **NORMAL),
+    PollEntry(param.BATT_CURRENT, topic=TOPIC + "batt_current", rule=CURRENT, **FAST),
+    PollEntry(param.BATT_POWER, topic=TOPIC + "batt_power", rule=POWER_W, **FAST),
+    PollEntry(param.BATT_SOC, topic=TOPIC + "batt_soc", rule=PERCENT, **NORMAL),
+    PollEntry(param.BATT_TEMP, topic=TOPIC + "batt_temp", rule=TEMPERATURE, **NORMAL),
+    PollEntry(param.BATT_CYCLE_PHASE, topic=TOPIC + "batt_cycle_phase", rule=EXACT, **NORMAL),
+    PollEntry(param.BATT_CHARGE, topic=TOPIC + "batt_charge", rule=EXACT, **SLOW),
+    PollEntry(param.BATT_DISCHARGE, topic=TOPIC + "batt_discharge", rule=EXACT, **SLOW),
+    PollEntry(param.BATT_CHARGE_PREV_DAY, topic=TOPIC + "batt_charge_prev_day", rule=EXACT, **HISTORY),
+    PollEntry(param.BATT_DISCHARGE_PREV_DAY, topic=TOPIC + "batt_discharge_prev_day", rule=EXACT, **HISTORY),
+    PollEntry(param.BATT_STATE_OF_HEALTH, topic=TOPIC + "batt_state_of_health", rule=PERCENT, **HISTORY),
+    PollEntry(param.BATT_REMAINING_AUTONOMY, topic=TOPIC + "batt_remaining_autonomy", rule=EXACT, **SLOW),
+    PollEntry(param.BATT_REMAINING_CAPACITY, topic=TOPIC + "batt_remaining_capacity", rule=EXACT, **SLOW),
+    PollEntry(param.BATT_NUM_CYCLES, topic=TOPIC + "batt_num_cycles", rule=EXACT, **HISTORY),
+    PollEntry(param.BATT_HISTORY_DEEPEST_DISCHARGE, topic=TOPIC + "batt_history_deepest_discharge", rule=EXACT, **HISTORY),
+    PollEntry(param.BATT_HISTORY_MAX_VOLTAGE, topic=TOPIC + "batt_history_max_voltage", rule=VOLTAGE, **HISTORY),
+    PollEntry(param.BATT_HISTORY_MIN_VOLTAGE, topic=TOPIC + "batt_history_min_voltage", rule=VOLTAGE, **HISTORY),
+    PollEntry(param.BATT_HISTORY_TOTAL_AH_CHARGED, topic=TOPIC + "batt_history_total_ah_charged", rule=EXACT, **HISTORY),
+    PollEntry(param.BATT_HISTORY_TOTAL_AH_DISCHARGED, topic=TOPIC + "batt_history_total_ah_discharged", rule=EXACT, **HISTORY),
+
+    # Statistiques batterie
+    PollEntry(param.NUM_BATTERY_UNDERVOLTAGES, topic=TOPIC + "num_battery_undervoltages", rule=EXACT, **HISTORY),
+    PollEntry(param.NUM_BATTERY_CRITICALS, topic=TOPIC + "num_battery_criticals", rule=EXACT, **HISTORY),
+    PollEntry(param.NUM_BATTERY_LOW, topic=TOPIC + "num_battery_low", rule=EXACT, **HISTORY),
+
+    # Panneaux Solaires (VarioTrack)
+    PollEntry(param.PV_VOLTAGE, topic=TOPIC + "pv_voltage", rule=VOLTAGE, **NORMAL),
+    PollEntry(param.PV_CURRENT, topic=TOPIC + "pv_current", rule=CURRENT, **FAST),
+    PollEntry(param.PV_POWER, topic=TOPIC + "pv_power", rule=POWER_W, **FAST),
+    PollEntry(param.PV_ENERGY_CURR_DAY, topic=TOPIC + "pv_energy_curr_day", rule=EXACT, **SLOW),
+    PollEntry(param.PV_ENERGY_PREV_DAY, topic=TOPIC + "pv_energy_prev_day", rule=EXACT, **HISTORY),
+    PollEntry(param.PV_ENERGY_TOTAL, topic=TOPIC + "pv_energy_total", rule=EXACT, **HISTORY),
+    PollEntry(param.PV_SUN_HOURS_CURR_DAY, topic=TOPIC + "pv_sun_hours_curr_day", rule=EXACT, **SLOW),
+    PollEntry(param.PV_SUN_HOURS_PREV_DAY, topic=TOPIC + "pv_sun_hours_prev_day", rule=EXACT, **HISTORY),
+    PollEntry(param.PV_OPERATING_MODE, topic=TOPIC + "pv_operating_mode", rule=EXACT, **NORMAL),
+    PollEntry(param.PV_CHARGING_CURRENT, topic=TOPIC + "pv_charging_current", rule=CURRENT, **FAST),
+    PollEntry(param.PV_CHARGING_POWER, topic=TOPIC + "pv_charging_power", rule=POWER_W, **FAST),
+    PollEntry(param.PV_INPUT_POWER_REDUCTION, topic=TOPIC + "pv_input_power_reduction", rule=PERCENT, **NORMAL),
+    PollEntry(param.PV_TEMPERATURE_INTERNAL, topic=TOPIC + "pv_temperature_internal", rule=TEMPERATURE, **NORMAL),
+    PollEntry(param.PV_TEMPERATURE_MAX_24H, topic=TOPIC + "pv_temperature_max_24h", rule=TEMPERATURE, **SLOW),
+    PollEntry(param.PV_TEMPERATURE_MAX_TOTAL, topic=TOPIC + "pv_temperature_max_total", rule=TEMPERATURE, **HISTORY),
+    PollEntry(param.PV_NUM_OVERTEMP_TODAY, topic=TOPIC + "pv_num_overtemp_today", rule=EXACT, **SLOW),
+    PollEntry(param.PV_NUM_OVERTEMP_TOTAL, topic=TOPIC + "pv_num_overtemp_total", rule=EXACT, **HISTORY),
+
+    # VarioString
+    PollEntry(param.VS_PV_POWER, topic=TOPIC + "vs_pv_power", rule=POWER_KW, **FAST),
+    PollEntry(param.VS_PV_VOLTAGE, topic=TOPIC + "vs_pv_voltage", rule=VOLTAGE, **NORMAL),
+    PollEntry(param.VS_PV_CURRENT, topic=TOPIC + "vs_pv_current", rule=CURRENT, **FAST),
+    PollEntry(param.VS_BATT_VOLTAGE, topic=TOPIC + "vs_batt_voltage", rule=VOLTAGE, **NORMAL),
+    PollEntry(param.VS_BATT_CURRENT, topic=TOPIC + "vs_batt_current", rule=CURRENT, **FAST),
+    PollEntry(param.VS_OPERATING_MODE, topic=TOPIC + "vs_operating_mode", rule=EXACT, **NORMAL),
+    PollEntry(param.VS_TEMPERATURE_INTERNAL, topic=TOPIC + "vs_temperature_internal", rule=TEMPERATURE, **NORMAL),
+    PollEntry(param.VS_PV_PROD, topic=TOPIC + "vs_pv_prod", rule=EXACT, **SLOW),
+    PollEntry(param.VS_ENERGY_TODAY, topic=TOPIC + "vs_energy_today", rule=EXACT, **SLOW),
+    PollEntry(param.VS_PV_ENERGY_PREV_DAY, topic=TOPIC + "vs_pv_energy_prev_day", rule=EXACT, **HISTORY),
+    PollEntry(param.VS_NUM_ERRORS_TODAY, topic=TOPIC + "vs_num_errors_today", rule=EXACT, **SLOW),
+    PollEntry(param.VS_NUM_ERRORS_TOTAL, topic=TOPIC + "vs_num_errors_total", rule=EXACT, **HISTORY),
+]
+
+def deviceProfile(devices: dict[str, list[int]], profile=POLLING_PROFILE) -> list[PollEntry]:
+    """
+    Profil adapté aux appareils présents sur le bus, `devices` associe à
+    chaque type d'appareil les adresses de ses unités (XcomAbs.scanDevices)
+    """
+    entries = list()
+
+    for entry in profile:
+        units = devices.get(getDeviceType(entry.datapoint.id))
+        if not units:
+            # type d'appareil absent de l'installation
+            continue
+
+        entries.append(entry)
+        if len(units) < 2:
+            continue
+
+        prefix, key = entry.topic.rsplit("/", 1)
+        for addr in units:
+            topic = f"{prefix}/{getDeviceType(entry.datapoint.id)}/{addr}/{key}"
+            entries.append(replace(entry, dstAddr=addr, topic=topic))
+
+    return entries
+
+def withTopic(prefix: str, profile=POLLING_PROFILE) -> list[PollEntry]:
+    """Copie du profil publiée sous `prefix` au lieu de TOPIC (une passerelle parmi plusieurs)"""
+    return [replace(e, topic=prefix + e.topic[len(TOPIC):]) for e in profile]
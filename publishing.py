@@ -0,0 +1,115 @@
+##
+# Règles de publication MQTT : détection de changement et bande morte
+##
+
+import json
+import time
+
+from dataclasses import dataclass
+
+from xcom_proto.parameters import getDeviceType, getDefaultAddress
+
+@dataclass
+class PublishRule:
+    """
+    Une valeur est publiée quand elle s'écarte de la dernière valeur publiée
+    de plus de max(absolute, relative * |dernière valeur|). Sans bande morte
+    (absolute == relative == 0) tout changement est publié, ce qui convient
+    aux compteurs et aux énumérations.
+
+    Quelle que soit la valeur, elle est republiée au moins toutes les
+    `heartbeat` secondes pour que Home Assistant ne la considère pas périmée.
+    """
+
+    absolute: float = 0
+    relative: float = 0
+    heartbeat: float = 300
+
+    def exceeds(self, last, value) -> bool:
+        if self.absolute == 0 and self.relative == 0:
+            return value != last
+
+        try:
+            return abs(value - last) > max(self.absolute, self.relative * abs(last))
+        except TypeError:
+            return value != last
+
+EXACT = PublishRule()
+
+class ChangeFilter:
+
+    def __init__(self, defaultRule: PublishRule = EXACT):
+        self.defaultRule = defaultRule
+        self.published = 0
+        self.suppressed = 0
+
+        # topic -> (dernière valeur publiée, instant de publication)
+        self._last: dict[str, tuple] = dict()
+
+    def shouldPublish(self, topic: str, value, rule: PublishRule = None, now: float = None) -> bool:
+        """Retourne True (et mémorise la valeur) si la valeur doit être publiée"""
+        rule = rule or self.defaultRule
+        now = time.monotonic() if now is None else now
+
+        last = self._last.get(topic)
+        if last is not None and now - last[1] < rule.heartbeat and not rule.exceeds(last[0], value):
+            self.suppressed += 1
+            return False
+
+        self._last[topic] = (value, now)
+        self.published += 1
+        return True
+
+    def forget(self, topic: str = None):
+        """Force la publication de la prochaine valeur (de tous les topics si None)"""
+        if topic is None:
+            self._last.clear()
+        else:
+            self._last.pop(topic, None)
+
+    def __str__(self) -> str:
+        return f"ChangeFilter(published={self.published}, suppressed={self.suppressed})"
+
+class GroupPublisher:
+    """
+    Mode JSON : une seule publication par groupe d'appareils (xtender, bsp,
+    variotrack, variostring) et par cycle, sur <prefix><groupe>. Le document
+    contient la dernière valeur publiée de chaque capteur du groupe, sous la
+    clé du topic individuel (ac_power_out, batt_soc, ...).
+
+    Les valeurs lues sur une unité particulière (Xtender 102, ...) forment
+    leur propre groupe <type>/<adresse>.
+    """
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self._documents: dict[str, dict] = dict()
+        self._dirty: set[str] = set()
+
+    @staticmethod
+    def groupOf(entry) -> str:
+        group = getDeviceType(entry.datapoint.id)
+        if entry.dstAddr != getDefaultAddress(entry.datapoint.id):
+            group += f"/{entry.dstAddr}"
+        return group
+
+    @staticmethod
+    def keyOf(entry) -> str:
+        return entry.topic.rsplit("/", 1)[-1]
+
+    def topicOf(self, group: str) -> str:
+        return self.prefix + group
+
+    def update(self, entry, value):
+        group = self.groupOf(entry)
+        self._documents.setdefault(group, dict())[self.keyOf(entry)] = value
+        self._dirty.add(group)
+
+    def flush(self, publish) -> int:
+        """Publie les groupes modifiés depuis le dernier appel, retourne leur nombre"""
+        count = len(self._dirty)
+        for group in self._dirty:
+            publish(self.topicOf(group), json.dumps(self._documents[group], separators=(",", ":")))
+
+        self._dirty.clear()
+        return count
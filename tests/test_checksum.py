@@ -0,0 +1,80 @@
+##
+# checksum() and Fletcher must match the original implementation byte by byte
+#
+# usage: python -m pytest tests
+##
+
+import random
+
+import pytest
+
+from xcom_proto import protocol
+from xcom_proto.protocol import Fletcher, checksum
+
+from benchmarks import legacy_protocol as legacy
+
+SIZES = [0, 1, 2, 11, 14, 255, 256, 1023, 1024, 1025, 2049, 4095, 4096, 4097, 70000]
+
+def randomBytes(size: int, seed: int = 0) -> bytes:
+    return random.Random(seed * 100003 + size).randbytes(size)
+
+def cases():
+    for size in SIZES:
+        yield bytes(size)
+        yield b'\xFF' * size
+        for seed in range(3):
+            yield randomBytes(size, seed)
+
+CASES = list(cases())
+IDS = [f"{len(data)}-{i % 5}" for i, data in enumerate(CASES)]
+
+@pytest.fixture(params=["numpy", "pure"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(protocol, "numpy", None)
+    return request.param
+
+@pytest.mark.parametrize("data", CASES, ids=IDS)
+def test_checksum(data, backend):
+    assert checksum(data) == legacy.checksum(data)
+
+@pytest.mark.parametrize("data", CASES, ids=IDS)
+def test_checksum_memoryview(data, backend):
+    assert checksum(memoryview(data)) == legacy.checksum(data)
+
+@pytest.mark.parametrize("data", CASES, ids=IDS)
+def test_fletcher(data, backend):
+    assert Fletcher(data).digest() == legacy.checksum(data)
+
+@pytest.mark.parametrize("piece", [1, 7, 1024, 1025, 4096])
+@pytest.mark.parametrize("size", [0, 1, 1024, 1025, 4097, 70000])
+def test_fletcher_incremental(size, piece, backend):
+    data = randomBytes(size)
+    incremental = Fletcher()
+    for start in range(0, size, piece):
+        incremental.update(data[start:start + piece])
+
+    assert incremental.digest() == legacy.checksum(data)
+
+def test_fletcher_copy():
+    data = randomBytes(3000)
+    first = Fletcher(data[:1000])
+    second = first.copy()
+    second.update(data[1000:])
+
+    assert first.digest() == legacy.checksum(data[:1000])
+    assert second.digest() == legacy.checksum(data)
+
+def test_numpy_path_used(monkeypatch):
+    numpy = pytest.importorskip("numpy")
+    calls = []
+    monkeypatch.setattr(protocol, "numpy", type("Spy", (), {
+        "uint8": numpy.uint8, "uint64": numpy.uint64, "cumsum": staticmethod(numpy.cumsum),
+        "frombuffer": staticmethod(lambda *a, **k: calls.append(1) or numpy.frombuffer(*a, **k)),
+    }))
+    data = randomBytes(Fletcher.NUMPY_THRESHOLD)
+
+    assert checksum(data) == legacy.checksum(data)
+    assert calls
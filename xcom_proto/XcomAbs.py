@@ -4,45 +4,471 @@
 # Abstract base class used by various implementations of the Xcom protocol
 ##
 
+import time
+import struct
 import logging
 
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 
 from .parameters import *
 from .protocol import Package
+from .retransmission import RetransmissionTimer, CircuitBreaker, retryDelay
+from .datalog import Message, LOG_ADDR
+from .snapshot import Snapshot, takeSnapshot
 
 MSG_MAX_LENGTH = 256 # from Studer Xcom documentation
 
+def getObjectType(id: int) -> bytes:
+    if 3000 <= id <= 3168:
+        return TYPE_INFO
+    elif id >= 7000:
+        return TYPE_INFO
+
+    return TYPE_PARAMETER
+
+def getRequestKey(package: Package) -> tuple:
+    """Key used to match a response to the request it answers"""
+    return (
+        package.frame_data.service_id,
+        package.frame_data.service_data.object_id,
+        package.header.dst_addr
+    )
+
+def getResponseKey(package: Package) -> tuple:
+    return (
+        package.frame_data.service_id,
+        package.frame_data.service_data.object_id,
+        package.header.src_addr
+    )
+
+def isMulticastReply(dstAddr: int, srcAddr: int) -> bool:
+    """True if srcAddr is one of the units reached by the multicast dstAddr"""
+    for device, addr in DEVICE_DEFAULT_ADDR.items():
+        units = DEVICE_ADDR_RANGES[device]
+        if addr == dstAddr and addr not in units:
+            return srcAddr in units
+
+    return False
+
+def matchPending(pending: dict, retPackage: Package):
+    key = getResponseKey(retPackage)
+    if key in pending:
+        return pending[key]
+
+    # replies to a multicast address come from the individual device,
+    # accept them if there is exactly one request to that multicast
+    # address they can belong to
+    candidates = [
+        v for k, v in pending.items()
+        if k[:2] == key[:2] and isMulticastReply(k[2], key[2])
+    ]
+    if len(candidates) == 1:
+        return candidates[0]
+
+    return None
+
+def isAnswer(request: Package, retPackage: Package) -> bool:
+    """Whether a package received on a stream (TCP) answers the request sent"""
+    return retPackage.isResponse() \
+        and retPackage.frame_data.service_id == request.frame_data.service_id \
+        and retPackage.frame_data.service_data.object_id == request.frame_data.service_data.object_id
+
+def readPackage(buf: bytes) -> tuple[Package, bytes]:
+    """
+    First package of a stream and the bytes after it, (None, bytes kept)
+    while it is incomplete. Bytes before a start byte and packages with a
+    wrong checksum are skipped.
+    """
+    while True:
+        start = buf.find(Package.start_byte)
+        if start < 0:
+            return None, b""
+        buf = buf[start:]
+
+        length = Package.packageLength(buf)
+        if length is None or len(buf) < length:
+            return None, buf
+
+        try:
+            return Package.unpackFrom(buf, 0), buf[length:]
+        except AssertionError:
+            # not the start of a package, look for the next start byte
+            buf = buf[1:]
+
+# errors meaning that a datapoint will never be readable at an address
+UNSUPPORTED_ERRORS = (
+    "DEVICE_NOT_FOUND", "SERVICE_NOT_SUPPORTED", "TYPE_NOT_SUPPORTED", "OBJECT_ID_NOT_FOUND",
+    "PROPERTY_NOT_SUPPORTED", "SCOM_ERROR_OBJECT_NOT_SUPPORTED",
+)
+
+# info object read to find out whether a unit is present
+DEVICE_PROBES = {
+    DEVICE_XTENDER:     Datapoint(3000, "XT_BATT_VOLTAGE", TYPE_FLOAT, "V"),
+    DEVICE_BSP:         Datapoint(7000, "BSP_BATT_VOLTAGE", TYPE_FLOAT, "V"),
+    DEVICE_VARIOTRACK:  Datapoint(11000, "VT_BATT_VOLTAGE", TYPE_FLOAT, "V"),
+    DEVICE_VARIOSTRING: Datapoint(15000, "VS_BATT_VOLTAGE", TYPE_FLOAT, "V"),
+}
+
+class RequestCache:
+    """Bounded LRU cache of ready to send read requests"""
+
+    def __init__(self, maxSize=256):
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple, Package] = OrderedDict()
+
+    def getReadRequest(self, object_id: int, object_type: bytes, property_id: bytes, dst_addr: int) -> Package:
+        key = (object_id, object_type, property_id, dst_addr)
+
+        request = self._entries.get(key)
+        if request is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return request
+
+        self.misses += 1
+        request = Package.genPackage(
+            service_id=PROPERTY_READ,
+            object_id=object_id,
+            object_type=object_type,
+            property_id=property_id,
+            property_data=b'',
+            dst_addr=dst_addr
+        ).freeze()
+
+        self._entries[key] = request
+        if len(self._entries) > self.maxSize:
+            self._entries.popitem(last=False)
+
+        return request
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __str__(self) -> str:
+        return f"RequestCache(size={len(self)}/{self.maxSize}, hits={self.hits}, misses={self.misses})"
+
+# time to live of a cached value, in seconds
+LIMIT_TTL = 24 * 3600       # QSP_MIN, QSP_MAX and QSP_LEVEL never change
+PARAMETER_TTL = 60          # changed by setValue (which invalidates it) or on the RCC
+HISTORY_TTL = 900           # previous day, totals and history counters
+INFO_TTL = 1.0
+
+HISTORY_NAMES = ("PREV_DAY", "TOTAL", "HISTORY")
+
+def getValueTTL(parameter: Datapoint, propertyID: bytes) -> float:
+    if propertyID in (QSP_MIN, QSP_MAX, QSP_LEVEL):
+        return LIMIT_TTL
+    if getObjectType(parameter.id) == TYPE_PARAMETER:
+        return PARAMETER_TTL
+    if any(n in parameter.name for n in HISTORY_NAMES):
+        return HISTORY_TTL
+    return INFO_TTL
+
+# returned by ValueCache.get when there is no usable value
+MISSING = object()
+
+class ValueCache:
+    """
+    Bounded LRU cache of the values read, by (dst_addr, object_id,
+    property_id, type): Dataset entries sharing an object id with another
+    type decode the same bytes differently. A value is used for its time to live (getValueTTL, or
+    `ttls` by object id), or for the `maxAge` given by the caller.
+    """
+
+    def __init__(self, maxSize=1024, ttls: dict[int, float] = None):
+        self.maxSize = maxSize
+        self.ttls = ttls or dict()
+        self.hits = 0
+        self.misses = 0
+        # key -> (value, time read, time to live)
+        self._entries: OrderedDict[tuple, tuple] = OrderedDict()
+
+    def get(self, dstAddr: int, parameter: Datapoint, propertyID: bytes, maxAge: float = None):
+        key = (dstAddr, parameter.id, propertyID, parameter.type)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, read, ttl = entry
+            if time.monotonic() - read <= (ttl if maxAge is None else maxAge):
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return value
+
+        self.misses += 1
+        return MISSING
+
+    def put(self, dstAddr: int, parameter: Datapoint, propertyID: bytes, value):
+        key = (dstAddr, parameter.id, propertyID, parameter.type)
+        ttl = self.ttls.get(parameter.id)
+        if ttl is None:
+            ttl = getValueTTL(parameter, propertyID)
+
+        self._entries[key] = (value, time.monotonic(), ttl)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxSize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, object_id: int):
+        """Drop the values of an object at every address, a write to a multicast address changes the units too"""
+        for key in [k for k in self._entries if k[1] == object_id and k[2] not in (QSP_MIN, QSP_MAX, QSP_LEVEL)]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __str__(self) -> str:
+        return f"ValueCache(size={len(self)}/{self.maxSize}, hits={self.hits}, misses={self.misses})"
+
 class XcomAbs(ABC):
 
+    requestCacheSize = 256
+    valueCacheSize = 0      # values kept by the read-through cache, 0 disables it
+
+    # adaptive timeouts and retries, see retransmission.py
+    timeout = 2             # upper bound of the timeout of a request
+    minTimeout = 0.2
+    retries = 2             # retransmissions of an unanswered request
+    retryDelay = 0.05       # first pause before a retry, doubled for every retry
+    maxRetryDelay = 1.0
+    breakerThreshold = 5    # unanswered requests in a row before failing fast
+    breakerResetTime = 30.0
+
+    # units found on the bus ({device type: [addresses]}), set by scanDevices,
+    # needed to read a multicast address unit by unit
+    devices: dict[str, list[int]] = None
+
     def __init__(self):
         self.log = logging.getLogger("XcomAbs")
 
+    @property
+    def requestCache(self) -> RequestCache:
+        # created lazily, implementations do not call XcomAbs.__init__
+        if "_requestCache" not in self.__dict__:
+            self._requestCache = RequestCache(self.requestCacheSize)
+        return self._requestCache
+
+    @property
+    def valueCache(self) -> ValueCache:
+        """Cache of the values read, None unless valueCacheSize is set"""
+        if "_valueCache" not in self.__dict__:
+            self._valueCache = ValueCache(self.valueCacheSize) if self.valueCacheSize else None
+        return self._valueCache
+
+    @property
+    def retransmission(self) -> RetransmissionTimer:
+        if "_retransmission" not in self.__dict__:
+            self._retransmission = RetransmissionTimer(self.timeout, self.minTimeout, self.timeout)
+        return self._retransmission
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        if "_breaker" not in self.__dict__:
+            self._breaker = CircuitBreaker(self.breakerThreshold, self.breakerResetTime)
+        return self._breaker
+
+    @property
+    def noMulticast(self) -> set[int]:
+        """Ids of the datapoints which cannot be read at a multicast address"""
+        if "_noMulticast" not in self.__dict__:
+            self._noMulticast = set()
+        return self._noMulticast
+
+    def _transact(self, exchange) -> Package:
+        """
+        Run exchange(timeout) -> Package, which raises TimeoutError when no
+        answer arrived in time, up to `retries` more times with a growing
+        timeout and a jittered pause in between. Error answers of the device
+        are answers too: they are not retried and keep the circuit closed.
+        """
+        self.breaker.check()
+
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                self.retransmission.retransmissions += 1
+                time.sleep(retryDelay(attempt, self.retryDelay, self.maxRetryDelay))
+
+            start = time.monotonic()
+            try:
+                response = exchange(self.retransmission.timeout(attempt))
+            except TimeoutError:
+                self.retransmission.timeouts += 1
+                continue
+            except KeyError:
+                # error answered by the device
+                if attempt == 0:
+                    self.retransmission.sample(time.monotonic() - start)
+                self.breaker.success()
+                raise
+
+            if attempt == 0:
+                self.retransmission.sample(time.monotonic() - start)
+            self.breaker.success()
+            return response
+
+        self.breaker.failure()
+        raise TimeoutError(f"no response after {self.retries + 1} attempts")
+
+    def _getReadRequest(self, parameter: Datapoint, dstAddr: int, propertyID: bytes) -> Package:
+        return self.requestCache.getReadRequest(
+            parameter.id, getObjectType(parameter.id), propertyID, dstAddr)
+
     def getValueByID(self, id: int, type: str, dstAddr=100, propertyID=QSP_UNSAVED_VALUE):
         return self.getValue(Datapoint(id, "", type), dstAddr, propertyID)
 
-    def getValue(self, parameter: Datapoint, dstAddr=100, propertyID=QSP_UNSAVED_VALUE):
+    def getValue(self, parameter: Datapoint, dstAddr=100, propertyID=QSP_UNSAVED_VALUE, maxAge: float = None):
+        """
+        dstAddr is a unit, a multicast address (100, 300, 700) or a list of
+        units, whose values are combined like a multicast read does.
+
+        With the value cache, a value read less than `maxAge` seconds ago
+        (its time to live without maxAge) is returned without any request,
+        maxAge=0 always reads it.
+        """
         self.log.debug(f"requesting value {parameter}")
 
-        objectType = TYPE_PARAMETER
+        if type(dstAddr) is not int or parameter.id in self.noMulticast:
+            return self.getValuesFrom([(parameter, dstAddr)], propertyID, maxAge=maxAge)[0]
 
-        if 3000 <= parameter.id <= 3168:
-            objectType = TYPE_INFO
-        elif parameter.id >= 7000:
-            objectType = TYPE_INFO
-        
-        request: Package = Package.genPackage(
-            service_id=PROPERTY_READ,
-            object_id=parameter.id,
-            object_type=objectType,
-            property_id=propertyID,
-            property_data=b'',
-            dst_addr=dstAddr
-        )
+        cache = self.valueCache
+        if cache is not None:
+            value = cache.get(dstAddr, parameter, propertyID, maxAge)
+            if value is not MISSING:
+                return value
 
-        response: Package = self.sendPackage(request)
+        request: Package = self._getReadRequest(parameter, dstAddr, propertyID)
+
+        try:
+            response: Package = self.sendPackage(request)
+        except KeyError as e:
+            if e.args[-1] != "SCOM_ERROR_MULTICAST_READ_NOT_SUPPORTED" or not self._canFanOut(parameter):
+                raise
+            self.noMulticast.add(parameter.id)
+            return self.getValuesFrom([(parameter, dstAddr)], propertyID, maxAge=maxAge)[0]
+
+        value = parameter.unpackValue(response.frame_data.service_data.property_data)
+        if cache is not None:
+            cache.put(dstAddr, parameter, propertyID, value)
+        return value
+
+    def getValues(self, parameters: list[Datapoint], dstAddr=100,
+            propertyID=QSP_UNSAVED_VALUE, return_exceptions=False, maxAge: float = None) -> list:
+        """
+        Read several values at once. Transports which can have more than one
+        request in flight (UDP) override sendPackages to overlap them.
+        """
+        return self.getValuesFrom([(p, dstAddr) for p in parameters], propertyID, return_exceptions, maxAge)
+
+    def getValuesFrom(self, reads: list[tuple[Datapoint, int]],
+            propertyID=QSP_UNSAVED_VALUE, return_exceptions=False, maxAge: float = None) -> list:
+        """
+        Same as getValues, with a (parameter, dstAddr) pair for each value.
+
+        A read at a multicast address refused with MULTICAST_READ_NOT_SUPPORTED
+        is done again unit by unit, which is remembered for that datapoint.
+        Lists of units are read at the multicast address when they are all
+        the units found and the datapoint supports it, unit by unit otherwise.
+        Only the values missing from the value cache are requested.
+        """
+        cache = self.valueCache
+        if cache is None:
+            values = self._readValues(reads, propertyID)
+        else:
+            values = [cache.get(dstAddr, p, propertyID, maxAge) if type(dstAddr) is int else MISSING
+                for p, dstAddr in reads]
+            missing = [i for i, v in enumerate(values) if v is MISSING]
+            for i, value in zip(missing, self._readValues([reads[i] for i in missing], propertyID)):
+                values[i] = value
+
+        if not return_exceptions:
+            for value in values:
+                if isinstance(value, Exception):
+                    raise value
+
+        return values
+
+    def _readValues(self, reads: list[tuple[Datapoint, int]], propertyID: bytes) -> list:
+        """Values (or exceptions) of getValuesFrom, stored in the value cache"""
+        plans = [self._readAddresses(p, dstAddr) for p, dstAddr in reads]
+
+        requests = list()
+        for (p, _), addresses in zip(reads, plans):
+            requests.extend(self._getReadRequest(p, addr, propertyID) for addr in addresses)
+        responses = iter(self.sendPackages(requests))
+
+        values = list()
+        fanOut = list()
+        for i, ((p, _), addresses) in enumerate(zip(reads, plans)):
+            unitValues = [self._unpack(p, next(responses)) for _ in addresses]
+            errors = [v for v in unitValues if isinstance(v, Exception)]
+
+            if not errors:
+                values.append(aggregateValues(p, unitValues))
+                continue
+
+            if isinstance(errors[0], KeyError) and errors[0].args[-1] == "SCOM_ERROR_MULTICAST_READ_NOT_SUPPORTED" \
+                    and self._canFanOut(p):
+                self.noMulticast.add(p.id)
+                fanOut.append(i)
+            values.append(errors[0])
+
+        if fanOut:
+            # the datapoint is now known to need it, so this is read unit by unit
+            retried = self._readValues([reads[i] for i in fanOut], propertyID)
+            for i, value in zip(fanOut, retried):
+                values[i] = value
+
+        cache = self.valueCache
+        if cache is not None:
+            for (p, dstAddr), value in zip(reads, values):
+                if type(dstAddr) is int and not isinstance(value, Exception):
+                    cache.put(dstAddr, p, propertyID, value)
+
+        return values
+
+    def _unpack(self, parameter: Datapoint, response):
+        if isinstance(response, Exception):
+            return response
+        try:
+            return parameter.unpackValue(response.frame_data.service_data.property_data)
+        except Exception as e:
+            return e
 
-        return parameter.unpackValue(response.frame_data.service_data.property_data)        
+    def _canFanOut(self, parameter: Datapoint) -> bool:
+        try:
+            return bool(self.devices and self.devices.get(getDeviceType(parameter.id)))
+        except UnknownDatapointException:
+            return False
+
+    def _readAddresses(self, parameter: Datapoint, dstAddr) -> list[int]:
+        """Addresses to read for the value of `parameter` at dstAddr"""
+        if type(dstAddr) is int and parameter.id not in self.noMulticast:
+            return [dstAddr]
+
+        try:
+            deviceType = getDeviceType(parameter.id)
+        except UnknownDatapointException:
+            return [dstAddr] if type(dstAddr) is int else list(dstAddr)
+
+        multicast = DEVICE_DEFAULT_ADDR[deviceType]
+        units = (self.devices or {}).get(deviceType)
+
+        if type(dstAddr) is int:
+            # multicast address of a datapoint read unit by unit
+            return list(units) if dstAddr == multicast and units else [dstAddr]
+
+        if parameter.id not in self.noMulticast and units and sorted(dstAddr) == sorted(units) \
+                and multicast not in DEVICE_ADDR_RANGES[deviceType]:
+            return [multicast]
+        return list(dstAddr)
 
     def setValueByID(self, id: int, type: str, value, dstAddr=100, propertyID=QSP_UNSAVED_VALUE):
         return self.setValue(Datapoint(id, "", type), value, dstAddr, propertyID)
@@ -59,13 +485,126 @@ class XcomAbs(ABC):
             dst_addr=dstAddr
         )
 
-        self.sendPackage(request)
+        try:
+            self.sendPackage(request)
+        finally:
+            # even a failed write may have been applied
+            if self.valueCache is not None:
+                self.valueCache.invalidate(parameter.id)
+
+    def scanDevices(self, deviceTypes=None) -> dict[str, list[int]]:
+        """
+        Find the individual units answering on the bus, returns the addresses
+        found for each device type. Addresses of a type are assigned without
+        gaps, so scanning a type stops at the first address not answering.
+        """
+        devices = dict()
+
+        for deviceType in deviceTypes or DEVICE_PROBES.keys():
+            probe = DEVICE_PROBES[deviceType]
+            found = list()
+
+            for addr in DEVICE_ADDR_RANGES[deviceType]:
+                if not self._probe(probe, addr):
+                    break
+                found.append(addr)
+
+            self.log.info(f"found {deviceType} units: {found}")
+            devices[deviceType] = found
+
+        self.devices = {**(self.devices or {}), **devices}
+        return devices
+
+    def _probe(self, parameter: Datapoint, dstAddr: int) -> bool:
+        try:
+            self.getValue(parameter, dstAddr)
+        except KeyError as e:
+            # any error other than these was sent by the device itself
+            return e.args[-1] not in ("DEVICE_NOT_FOUND", "RESPONSE_TIMEOUT")
+        except Exception:
+            return False
+
+        return True
+
+    def probeDatapoints(self, reads: list[tuple[Datapoint, int]]) -> list:
+        """
+        Read every (parameter, dstAddr) pair once, returns for each one True
+        if it answered, False if it never will (error in UNSUPPORTED_ERRORS
+        or an answer which cannot be decoded as this parameter) and None when
+        it is unknown (timeout, busy gateway, ...).
+        """
+        supported = list()
+
+        for value in self.getValuesFrom(reads, return_exceptions=True):
+            if not isinstance(value, Exception):
+                supported.append(True)
+            elif isinstance(value, KeyError):
+                supported.append(False if value.args[-1] in UNSUPPORTED_ERRORS else None)
+            elif isinstance(value, (struct.error, ValueError)):
+                supported.append(False)
+            else:
+                supported.append(None)
+
+        return supported
+
+    ## configuration snapshots, see snapshot.py
+
+    def snapshot(self, previous: Snapshot = None, devices: dict[str, list[int]] = None,
+            rate: float = None) -> Snapshot:
+        """Parameters of every unit, only their values are read again with a previous snapshot"""
+        return takeSnapshot(self, devices, previous, rate=rate)
+
+    ## event log, see datalog.py
+
+    def getMessage(self, index: int, dstAddr=LOG_ADDR) -> Message:
+        request = Package.genPackage(PROPERTY_READ, index, TYPE_MESSAGE, MESSAGE_READ, b"", dst_addr=dstAddr)
+        response: Package = self.sendPackage(request)
+
+        return Message.unpack(index, response.frame_data.service_data.property_data)
+
+    def getMessages(self, start=0, count: int = None, dstAddr=LOG_ADDR) -> list[Message]:
+        """
+        Messages of the event log from index `start` on, all the following
+        ones without `count`. The first read tells how many there are, the
+        others are sent together (overlapped by the pipelining transports).
+        """
+        try:
+            first = self.getMessage(start, dstAddr)
+        except KeyError as e:
+            if e.args[-1] == "OBJECT_ID_NOT_FOUND":
+                # no message after `start`
+                return []
+            raise
+
+        end = first.total if count is None else min(first.total, start + count)
+        indexes = range(start + 1, end)
+        requests = [Package.genPackage(PROPERTY_READ, i, TYPE_MESSAGE, MESSAGE_READ, b"", dst_addr=dstAddr)
+            for i in indexes]
+
+        messages = [first]
+        for index, response in zip(indexes, self.sendPackages(requests)):
+            if isinstance(response, Exception):
+                raise response
+            messages.append(Message.unpack(index, response.frame_data.service_data.property_data))
+
+        return messages
 
     ## TODO
     #def setProperty():
     #    raise NotImplementedError
     
 
+    def sendPackages(self, packages: list[Package]) -> list:
+        """Send all packages, returns the response or the raised exception for each"""
+        responses = list()
+        for package in packages:
+            try:
+                responses.append(self.sendPackage(package))
+            except Exception as e:
+                responses.append(e)
+
+        return responses
+
     @abstractmethod
     def sendPackage(self, package: Package)  -> Package:
         raise NotImplementedError
\ No newline at end of file
@@ -0,0 +1,424 @@
+#! /usr/bin/env python3
+
+##
+# asyncio implementations of the Xcom protocol (serial, LAN UDP and LAN TCP)
+##
+
+import asyncio
+import logging
+import socket
+import time
+
+from abc import ABC, abstractmethod
+from collections import defaultdict
+
+import serial
+
+from .parameters import *
+from .protocol import Package
+from .XcomAbs import MSG_MAX_LENGTH, RequestCache, getObjectType, getRequestKey, matchPending, isAnswer, readPackage
+from .XcomRS232 import SERIAL_TERMINATOR
+from .retransmission import RetransmissionTimer, CircuitBreaker, retryDelay
+
+class AsyncXcomAbs(ABC):
+
+    requestCacheSize = 256
+
+    # adaptive timeouts and retries, same as XcomAbs
+    timeout = 2
+    minTimeout = 0.2
+    retries = 2
+    retryDelay = 0.05
+    maxRetryDelay = 1.0
+    breakerThreshold = 5
+    breakerResetTime = 30.0
+
+    def __init__(self):
+        self.log = logging.getLogger("AsyncXcomAbs")
+
+    @property
+    def requestCache(self) -> RequestCache:
+        if "_requestCache" not in self.__dict__:
+            self._requestCache = RequestCache(self.requestCacheSize)
+        return self._requestCache
+
+    @property
+    def retransmission(self) -> RetransmissionTimer:
+        if "_retransmission" not in self.__dict__:
+            self._retransmission = RetransmissionTimer(self.timeout, self.minTimeout, self.timeout)
+        return self._retransmission
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        if "_breaker" not in self.__dict__:
+            self._breaker = CircuitBreaker(self.breakerThreshold, self.breakerResetTime)
+        return self._breaker
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, error_type, error, traceback) -> bool:
+        await self.close()
+        return False
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def getValueByID(self, id: int, type: str, dstAddr=100, propertyID=QSP_UNSAVED_VALUE):
+        return await self.getValue(Datapoint(id, "", type), dstAddr, propertyID)
+
+    async def getValue(self, parameter: Datapoint, dstAddr=100, propertyID=QSP_UNSAVED_VALUE):
+        self.log.debug(f"requesting value {parameter}")
+
+        request: Package = self.requestCache.getReadRequest(
+            parameter.id, getObjectType(parameter.id), propertyID, dstAddr)
+
+        response: Package = await self.sendPackage(request)
+
+        return parameter.unpackValue(response.frame_data.service_data.property_data)
+
+    async def getValues(self, parameters: list[Datapoint], dstAddr=100,
+            propertyID=QSP_UNSAVED_VALUE, return_exceptions=False) -> list:
+        """
+        Read several values at once. Transports which can have more than one
+        request in flight (UDP) overlap them, the others serialize internally.
+        """
+        return await asyncio.gather(
+            *(self.getValue(p, dstAddr, propertyID) for p in parameters),
+            return_exceptions=return_exceptions
+        )
+
+    async def setValueByID(self, id: int, type: str, value, dstAddr=100, propertyID=QSP_UNSAVED_VALUE):
+        return await self.setValue(Datapoint(id, "", type), value, dstAddr, propertyID)
+
+    async def setValue(self, parameter: Datapoint, value, dstAddr=100, propertyID=QSP_UNSAVED_VALUE):
+        self.log.debug(f"setting value {parameter}")
+
+        request: Package = Package.genPackage(
+            service_id=PROPERTY_WRITE,
+            object_id=parameter.id,
+            object_type=TYPE_PARAMETER,
+            property_id=propertyID,
+            property_data=parameter.packValue(value),
+            dst_addr=dstAddr
+        )
+
+        await self.sendPackage(request)
+
+    async def sendPackage(self, package: Package) -> Package:
+        return await self._transact(package)
+
+    @abstractmethod
+    async def _exchange(self, package: Package, timeout: float) -> tuple[Package, float]:
+        """
+        Single attempt, raises TimeoutError without answer after `timeout`
+        seconds. Returns the unchecked response and the round trip time,
+        measured from the moment the request was actually sent.
+        """
+        raise NotImplementedError
+
+    async def _transact(self, package: Package) -> Package:
+        """See XcomAbs._transact"""
+        self.breaker.check()
+
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                self.retransmission.retransmissions += 1
+                await asyncio.sleep(retryDelay(attempt, self.retryDelay, self.maxRetryDelay))
+
+            try:
+                response, rtt = await self._exchange(package, self.retransmission.timeout(attempt))
+            except (TimeoutError, asyncio.TimeoutError):
+                self.retransmission.timeouts += 1
+                continue
+
+            # error answers of the device are answers too
+            if attempt == 0:
+                self.retransmission.sample(rtt)
+            self.breaker.success()
+            return self._checkResponse(response)
+
+        self.breaker.failure()
+        raise TimeoutError(f"no response after {self.retries + 1} attempts")
+
+    def _checkResponse(self, retPackage: Package) -> Package:
+        self.log.debug(retPackage)
+
+        if err := retPackage.getError():
+            raise KeyError("Error received", err)
+
+        return retPackage
+
+##
+# Xcom-RS232i, driven by the event loop through the file descriptor of the port
+##
+
+class AsyncXcomRS232(AsyncXcomAbs):
+
+    def __init__(self, serialDevice: str, baudrate: int, timeout=2):
+        self.serialDevice = serialDevice
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.log = logging.getLogger("AsyncXcomRS232")
+
+        self.ser: serial.Serial = None
+        # created by open(): before Python 3.10, a lock is bound to the event
+        # loop current when it is created, not to the one which uses it
+        self._lock: asyncio.Lock = None
+        self._buffer = bytearray()
+        self._waiter: asyncio.Future = None
+
+    async def open(self):
+        if self.ser is not None:
+            return
+
+        self.ser = serial.Serial(self.serialDevice, self.baudrate, timeout=0)
+        self._lock = asyncio.Lock()
+        asyncio.get_running_loop().add_reader(self.ser.fileno(), self._onReadable)
+
+    async def close(self):
+        if self.ser is None:
+            return
+
+        asyncio.get_running_loop().remove_reader(self.ser.fileno())
+        self.ser.close()
+        self.ser = None
+
+    def _onReadable(self):
+        try:
+            self._buffer += self.ser.read(self.ser.in_waiting or 1)
+        except serial.SerialException as e:
+            if self._waiter and not self._waiter.done():
+                self._waiter.set_exception(e)
+            return
+
+        # framed by the length in the header, not by the terminator which
+        # may appear in the payload
+        end = Package.packageLength(self._buffer)
+        if end is None or len(self._buffer) < end + len(SERIAL_TERMINATOR):
+            if len(self._buffer) < MSG_MAX_LENGTH:
+                return
+            end = len(self._buffer)
+
+        if self._waiter and not self._waiter.done():
+            self._waiter.set_result(bytes(self._buffer[:end]))
+            del self._buffer[:end + len(SERIAL_TERMINATOR)]
+        else:
+            # nobody is waiting, this is stale data
+            self._buffer.clear()
+
+    async def _exchange(self, package: Package, timeout: float) -> tuple[Package, float]:
+        data: bytes = package.getBytes() + SERIAL_TERMINATOR
+
+        await self.open()
+
+        async with self._lock:
+            self._buffer.clear()
+            self._waiter = asyncio.get_running_loop().create_future()
+
+            self.log.debug(f" --> {data.hex()}")
+            self.ser.write(data)
+            sent = time.monotonic()
+
+            try:
+                response: bytes = await asyncio.wait_for(self._waiter, timeout)
+            finally:
+                self._waiter = None
+
+            self.log.debug(f" <-- {response.hex()}")
+            rtt = time.monotonic() - sent
+
+        if len(response) == 0:
+            raise TimeoutError("no response from Xcom-232i")
+
+        return Package.parseBytes(response), rtt
+
+##
+# Xcom-LAN TCP, the MOXA connects to the server we are creating here
+##
+
+class AsyncXcomLANTCP(AsyncXcomAbs):
+
+    def __init__(self, port=4001, timeout=2):
+        self.localPort = port
+        self.timeout = timeout
+        self.log = logging.getLogger("AsyncXcomLANTCP")
+
+        self._lock: asyncio.Lock = None      # created by open(), see AsyncXcomRS232
+        self._server: asyncio.AbstractServer = None
+        self._connected: asyncio.Future = None
+        self._buffer = b""                  # received, not parsed yet
+
+    async def open(self):
+        if self._server is not None:
+            return
+
+        self.log.info(f"Starting TCP server on port {self.localPort}")
+
+        self._lock = asyncio.Lock()
+        self._connected = asyncio.get_running_loop().create_future()
+        self._server = await asyncio.start_server(self._onConnect, port=self.localPort, reuse_address=True)
+
+        self.log.info("Waiting for MOXA to connect...")
+        await self._connected
+
+    async def close(self):
+        if self._server is None:
+            return
+
+        if self._connected.done():
+            _, writer = self._connected.result()
+            writer.close()
+
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _onConnect(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.log.debug(f"Got connection from {writer.get_extra_info('peername')}")
+
+        if self._connected.done():
+            # only a single MOXA is supported
+            writer.close()
+            return
+
+        self._connected.set_result((reader, writer))
+
+    async def _exchange(self, package: Package, timeout: float) -> tuple[Package, float]:
+        data: bytes = package.getBytes()
+
+        await self.open()
+
+        async with self._lock:
+            reader, writer = await self._connected
+            deadline = time.monotonic() + timeout
+
+            # drop what is left over from a previous timed out request
+            self._buffer = b""
+
+            self.log.debug(f" --> {data.hex()}")
+            writer.write(data)
+            await writer.drain()
+            sent = time.monotonic()
+
+            while True:
+                retPackage = await self._nextPackage(reader, deadline)
+
+                if isAnswer(package, retPackage):
+                    break
+
+                # MOXA sometimes sends unrelated data: it is skipped, the
+                # answer follows within the same timeout
+                self.log.debug(f"dropping unrelated package {retPackage}")
+
+        return retPackage, time.monotonic() - sent
+
+    async def _nextPackage(self, reader: asyncio.StreamReader, deadline: float) -> Package:
+        """Next package of the stream, see XcomLANTCP._nextPackage"""
+        while True:
+            retPackage, self._buffer = readPackage(self._buffer)
+            if retPackage is not None:
+                return retPackage
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("no response from MOXA")
+
+            response: bytes = await asyncio.wait_for(reader.read(MSG_MAX_LENGTH), remaining)
+            self.log.debug(f" <-- {response.hex()}")
+
+            if not response:
+                raise ConnectionResetError("MOXA closed the connection")
+            self._buffer += response
+
+##
+# Xcom-LAN UDP, responses arrive on srcPort and are matched to pending requests
+##
+
+class _UDPResponseProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, client):
+        self.client = client
+
+    def datagram_received(self, data: bytes, addr):
+        self.client._onDatagram(data)
+
+class AsyncXcomLANUDP(AsyncXcomAbs):
+
+    def __init__(self, serverIP: str, dstPort=4002, srcPort=4001, timeout=2):
+        self.serverAddress = (serverIP, dstPort)
+        self.clientPort = srcPort
+        self.timeout = timeout
+        self.log = logging.getLogger("AsyncXcomLANUDP")
+
+        self._transport: asyncio.DatagramTransport = None
+        self._pending: dict[tuple, asyncio.Future] = dict()
+        self._keyLocks: defaultdict[tuple, asyncio.Lock] = None    # created by open(), see AsyncXcomRS232
+
+    async def open(self):
+        if self._transport is not None:
+            return
+
+        self._keyLocks = defaultdict(asyncio.Lock)
+
+        # XcomLAN answers to <ourIP>:srcPort, not to the sending endpoint,
+        # so a single socket bound to srcPort is used for both directions
+        self._transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: _UDPResponseProtocol(self),
+            local_addr=("0.0.0.0", self.clientPort),
+            family=socket.AF_INET
+        )
+
+    async def close(self):
+        if self._transport is None:
+            return
+
+        self._transport.close()
+        self._transport = None
+
+        for future in self._pending.values():
+            if not future.done():
+                future.cancel()
+        self._pending.clear()
+
+    def _onDatagram(self, data: bytes):
+        self.log.debug(f" <-- {data.hex()}")
+
+        try:
+            retPackage = Package.parseBytes(data)
+        except AssertionError as e:
+            self.log.warning(f"dropping invalid datagram: {e}")
+            return
+
+        future = matchPending(self._pending, retPackage)
+        if future is None or future.done():
+            self.log.debug("dropping unexpected datagram")
+            return
+
+        future.set_result(retPackage)
+
+    async def _exchange(self, package: Package, timeout: float) -> tuple[Package, float]:
+        await self.open()
+
+        data: bytes = package.getBytes()
+        key = getRequestKey(package)
+
+        # responses can only be told apart by service, object and address
+        async with self._keyLocks[key]:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[key] = future
+
+            try:
+                self.log.debug(f" --> {data.hex()}")
+                self._transport.sendto(data, self.serverAddress)
+                sent = time.monotonic()
+
+                retPackage: Package = await asyncio.wait_for(future, timeout)
+            finally:
+                del self._pending[key]
+
+        return retPackage, time.monotonic() - sent
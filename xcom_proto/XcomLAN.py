@@ -1,12 +1,20 @@
 #! /usr/bin/env python3
 
+import time
 import socket
 import logging
+import threading
 
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 from .protocol import Package
-from .XcomAbs import XcomAbs, MSG_MAX_LENGTH
+from .XcomAbs import XcomAbs, MSG_MAX_LENGTH, getRequestKey, matchPending, isAnswer, readPackage
+from .retransmission import CircuitOpenError, retryDelay
+
+# seconds a caller waits past the deadline of a request for the receiver
+# thread to expire it
+EXPIRE_GRACE = 0.5
 
 ##
 # Class abstracting Xcom-LAN TCP network protocol
@@ -14,16 +22,22 @@ from .XcomAbs import XcomAbs, MSG_MAX_LENGTH
 
 class XcomLANTCP(XcomAbs):
 
-    def __init__(self, port=4001):
+    def __init__(self, port=4001, timeout=2):
         """
         MOXA is connecting to the TCP Server we are creating here.
 
-        Once it is connected we can send package requests.
+        Once it is connected we can send package requests, each one times out
+        after the estimated round trip time (at most `timeout` seconds).
         """
 
         self.localPort = port
+        self.timeout = timeout
         self.log = logging.getLogger("XcomLANTCP")
 
+        # bytes received but not parsed yet, the stream is cut into packages
+        # by their length
+        self._buffer = b""
+
     def __enter__(self):
         self.log.info(f"Starting TCP server on port {self.localPort}")
 
@@ -51,39 +65,74 @@ class XcomLANTCP(XcomAbs):
         return True
 
     def sendPackage(self, package: Package) -> Package:
+        return self._transact(lambda timeout: self._exchange(package, timeout))
+
+    def _exchange(self, package: Package, timeout: float) -> Package:
         data: bytes = package.getBytes()
-        
+        deadline = time.monotonic() + timeout
+
+        # drop what is left over from a previous timed out request
+        self._buffer = b""
+
         self.log.debug(f" --> {data.hex()}")
-        self.conn.send(data)
+        self.conn.sendall(data)
 
-        response: bytes = self.conn.recv(MSG_MAX_LENGTH)
-        self.log.debug(f" <-- {response.hex()}")
-        
-        retPackage = Package.parseBytes(response)
-        self.log.debug(retPackage)
+        while True:
+            retPackage = self._nextPackage(deadline)
 
-        # MOXA sometimes sends unrelated data, so we need to ignore those
-        # and resend our request
-        try:
-            assert retPackage.isResponse()
-            assert retPackage.frame_data.service_id == package.frame_data.service_id
-            assert retPackage.frame_data.service_data.object_id == package.frame_data.service_data.object_id
-        except AssertionError:
-            return self.sendPackage(package)
+            if isAnswer(package, retPackage):
+                break
+
+            # MOXA sometimes sends unrelated data: it is skipped, the answer
+            # follows within the same timeout
+            self.log.debug(f"dropping unrelated package {retPackage}")
 
         if err := retPackage.getError():
             raise KeyError("Error received", err)
 
         return retPackage
 
+    def _nextPackage(self, deadline: float) -> Package:
+        """Next package of the stream, several can arrive in one recv and one in several"""
+        while True:
+            retPackage, self._buffer = readPackage(self._buffer)
+            if retPackage is not None:
+                self.log.debug(retPackage)
+                return retPackage
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("no response from MOXA")
+
+            self.conn.settimeout(remaining)
+            try:
+                response: bytes = self.conn.recv(MSG_MAX_LENGTH)
+            except socket.timeout:
+                # not a TimeoutError before Python 3.10
+                raise TimeoutError("no response from MOXA") from None
+            self.log.debug(f" <-- {response.hex()}")
+
+            if not response:
+                raise ConnectionResetError("MOXA closed the connection")
+            self._buffer += response
+
 
 ##
 # Class abstracting Xcom-LAN UDP network protocol
 ##
 
+class _PendingRequest:
+
+    def __init__(self, package: Package, deadline: float):
+        self.package = package
+        self.deadline = deadline
+        self.future = Future()
+        self.sent = time.monotonic()
+        self.answered: float = None
+
 class XcomLANUDP(XcomAbs):
 
-    def __init__(self, serverIP: str, dstPort=4002, srcPort=4001):
+    def __init__(self, serverIP: str, dstPort=4002, srcPort=4001, timeout=2, window=4):
         """
         Package requests are being sent to serverIP : dstPort using UDP protocol.
 
@@ -92,47 +141,198 @@ class XcomLANUDP(XcomAbs):
         planet would do) but rather to <yourIP> : srcPort.
 
         So in order to make this work, we need to listen on srcPort for incoming
-        data.
+        data. A single background thread receives everything arriving there and
+        hands each response to the pending request with the same service id,
+        object id and address. Up to `window` requests can be in flight at
+        once. A request without answer after the estimated round trip time
+        (at most `timeout` seconds) is sent again up to `retries` times.
         """
 
         self.serverAddress = (serverIP, dstPort)
         self.clientPort = srcPort
+        self.timeout = timeout # 2s as recommended by Studer Xcom documentation
         self.log = logging.getLogger("XcomLAN")
 
-        self.udpListener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.udpListener.bind(("", self.clientPort))
-        self.udpListener.settimeout(2) # as recommended by Studer Xcom documentation
+        self.udpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udpSocket.bind(("", self.clientPort))
+        self.udpSocket.settimeout(0.1)
 
-    def sendPackage(self, package: Package) -> Package:
+        self._pending: dict[tuple, _PendingRequest] = dict()
+        self._lock = threading.Condition()
+        self._window = threading.BoundedSemaphore(window)
+        self._running = True
+
+        self._receiver = threading.Thread(target=self._receiveLoop, name="XcomLANUDP-receiver", daemon=True)
+        self._receiver.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, error_type, error, traceback) -> bool:
+        self.close()
+
+        if error:
+            return False
+        return True
+
+    def close(self):
+        self._running = False
+        self._receiver.join()
+        self.udpSocket.close()
+        self._failPending(ConnectionAbortedError("XcomLANUDP closed"))
+
+    def _failPending(self, error: Exception):
+        """Resolve every pending request with error, nothing can answer them anymore"""
+        with self._lock:
+            for request in self._pending.values():
+                request.future.set_exception(error)
+            self._pending.clear()
+            self._lock.notify_all()
+
+    def submit(self, package: Package, timeout: float = None) -> Future:
+        """Send a request without waiting for the answer, blocks while the window is full"""
+        return self._submit(package, timeout or self.retransmission.timeout()).future
+
+    def _submit(self, package: Package, timeout: float) -> _PendingRequest:
+        key = getRequestKey(package)
         data: bytes = package.getBytes()
-        
-        with ThreadPoolExecutor() as listener, \
-                socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sender:
-            self.log.debug(f" --> {data.hex()}")
 
-            future = listener.submit(self._awaitUDPResponse, self.udpListener)
+        self._window.acquire()
 
-            sender.sendto(data, self.serverAddress)
+        with self._lock:
+            # responses can only be told apart by their key, so wait for an
+            # older request with the same key to finish
+            while key in self._pending:
+                self._lock.wait()
 
-            value = future.result(10) 
-            self.log.debug(f" <-- {value}")
+            if not self._running:
+                self._window.release()
+                raise ConnectionAbortedError("XcomLANUDP closed")
 
-        if not value:
-            raise ValueError("Package listener returned None")
+            request = _PendingRequest(package, time.monotonic() + timeout)
+            request.future.add_done_callback(lambda _: self._window.release())
+            self._pending[key] = request
 
-        retPackage = Package.parseBytes(value)
-        self.log.debug(retPackage)
+        self.log.debug(f" --> {data.hex()}")
+        self.udpSocket.sendto(data, self.serverAddress)
 
-        if err := retPackage.getError():
-            raise KeyError("Error received", err)
-        
-        return retPackage
+        return request
+
+    def sendPackage(self, package: Package, timeout: float = None) -> Package:
+        if timeout is not None:
+            # explicit timeout, single attempt
+            return self._result(self._submit(package, timeout))
+
+        return self._transact(lambda timeout: self._result(self._submit(package, timeout)))
+
+    def _result(self, request: _PendingRequest) -> Package:
+        """Wait for the answer to request, at most until its deadline"""
+        try:
+            return request.future.result(max(0, request.deadline - time.monotonic()) + EXPIRE_GRACE)
+        except FutureTimeoutError:
+            # not the builtin TimeoutError before Python 3.11, the receiver
+            # did not expire the request in time so do it here
+            with self._lock:
+                self._expire(time.monotonic())
+            return request.future.result(0)
+
+    def sendPackages(self, packages: list[Package]) -> list:
+        """
+        Pipelined version of _transact: all the requests are sent, then the
+        ones which timed out are sent again together, up to `retries` times.
+        """
+        responses: list = [None] * len(packages)
+        todo = list(range(len(packages)))
+
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                self.retransmission.retransmissions += len(todo)
+                time.sleep(retryDelay(attempt, self.retryDelay, self.maxRetryDelay))
+
+            requests = dict()
+            for i in todo:
+                try:
+                    self.breaker.check()
+                except CircuitOpenError as e:
+                    responses[i] = e
+                    continue
+                requests[i] = self._submit(packages[i], self.retransmission.timeout(attempt))
+
+            todo = list()
+            for i, request in requests.items():
+                try:
+                    responses[i] = self._result(request)
+                except TimeoutError as e:
+                    self.retransmission.timeouts += 1
+                    responses[i] = e
+                    todo.append(i)
+                    continue
+                except Exception as e:
+                    responses[i] = e
+
+                if request.answered is not None:
+                    # error answered by the device or a response
+                    if attempt == 0:
+                        self.retransmission.sample(request.answered - request.sent)
+                    self.breaker.success()
+
+            if not todo:
+                break
+
+        for i in todo:
+            self.breaker.failure()
+            responses[i] = TimeoutError(f"no response after {self.retries + 1} attempts")
+
+        return responses
+
+    def _receiveLoop(self):
+        while self._running:
+            try:
+                data = self.udpSocket.recv(MSG_MAX_LENGTH)
+            except socket.timeout:
+                data = None
+            except OSError as e:
+                self.log.error(f"receiving from XcomLAN failed: {e}")
+                self._running = False
+                self._failPending(ConnectionAbortedError(f"XcomLANUDP receiver stopped: {e}"))
+                break
+
+            with self._lock:
+                if data:
+                    self._dispatch(data)
+                self._expire(time.monotonic())
+
+    def _dispatch(self, data: bytes):
+        self.log.debug(f" <-- {data.hex()}")
 
-    def _awaitUDPResponse(self, udpSocket: socket.socket) -> bytes:
         try:
-            response = udpSocket.recv(MSG_MAX_LENGTH)
-        except socket.timeout:
-            self.log.error("Waiting for response from XcomLAN timed out")
-            raise
+            retPackage = Package.parseBytes(data)
+        except AssertionError as e:
+            self.log.warning(f"dropping invalid datagram: {e}")
+            return
+
+        request: _PendingRequest = matchPending(self._pending, retPackage)
+        if request is None:
+            # most likely a late answer to a request which already timed out
+            self.log.debug("dropping unexpected datagram")
+            return
+
+        request.answered = time.monotonic()
+        self._finish(request)
+        self.log.debug(retPackage)
 
-        return response
+        if err := retPackage.getError():
+            request.future.set_exception(KeyError("Error received", err))
+        else:
+            request.future.set_result(retPackage)
+
+    def _expire(self, now: float):
+        for request in [r for r in self._pending.values() if r.deadline <= now]:
+            self.log.warning("Waiting for response from XcomLAN timed out")
+            self._finish(request)
+            # not socket.timeout, which is no TimeoutError before Python 3.10
+            request.future.set_exception(TimeoutError("no response from XcomLAN"))
+
+    def _finish(self, request: _PendingRequest):
+        del self._pending[getRequestKey(request.package)]
+        self._lock.notify_all()
@@ -4,32 +4,125 @@
 # Class abstracting Xcom-RS232i serial protocol
 ##
 
+import time
 import serial
 import logging
 
-from .protocol import Package
-from .XcomAbs import XcomAbs, MSG_MAX_LENGTH
+from .protocol import Package, Header
+from .XcomAbs import XcomAbs
 
 SERIAL_TERMINATOR = b'\x0D\x0A' # from Studer Xcom documentation
+POLL_INTERVAL = 0.005 # seconds between checks of the receive buffer
+
+class SessionStats:
+    """
+    Time spent opening / configuring the port compared to actual I/O, the
+    pauses between failed opens are counted apart in backoffTime
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.opens = 0
+        self.reconnects = 0
+        self.setupTime = 0.0
+        self.backoffTime = 0.0
+        self.ioTime = 0.0
+
+    def __str__(self) -> str:
+        return (f"SessionStats(requests={self.requests}, opens={self.opens}, "
+                f"reconnects={self.reconnects}, setup={self.setupTime*1000:.1f}ms, "
+                f"backoff={self.backoffTime*1000:.1f}ms, io={self.ioTime*1000:.1f}ms)")
 
 class XcomRS232(XcomAbs):
 
-    def __init__(self, serialDevice: str, baudrate: int, timeout=2):
+    def __init__(self, serialDevice: str, baudrate: int, timeout=2,
+            reconnectDelay=0.5, maxReconnectDelay=30, reconnectAttempts=5):
+        """
+        The serial port is kept open between requests. It is either opened
+        explicitly (context manager / open()) or lazily on the first request.
+
+        If the port goes away (e.g. USB adapter unplugged) it is closed and
+        reopened with exponential backoff starting at reconnectDelay seconds.
+
+        A request times out after the estimated round trip time (at most
+        `timeout` seconds) and is sent again up to `retries` times.
+        """
+
         self.serialDevice = serialDevice
         self.baudrate = baudrate
         self.timeout = timeout
+        self.reconnectDelay = reconnectDelay
+        self.maxReconnectDelay = maxReconnectDelay
+        self.reconnectAttempts = reconnectAttempts
         self.log = logging.getLogger("XcomRS232")
 
+        self.ser: serial.Serial = None
+        self.stats = SessionStats()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, error_type, error, traceback) -> bool:
+        self.close()
+
+        if error:
+            return False
+        return True
+
+    def open(self):
+        if self.ser is not None and self.ser.is_open:
+            return
+
+        delay = self.reconnectDelay
+        for attempt in range(1, self.reconnectAttempts + 1):
+            start = time.perf_counter()
+            try:
+                self.ser = serial.Serial(self.serialDevice, self.baudrate, timeout=self.timeout)
+                self.stats.opens += 1
+                return
+            except (serial.SerialException, OSError) as e:
+                if attempt == self.reconnectAttempts:
+                    raise
+                error = e
+            finally:
+                self.stats.setupTime += time.perf_counter() - start
+
+            self.log.warning(f"opening {self.serialDevice} failed ({error}), retrying in {delay}s")
+            start = time.perf_counter()
+            time.sleep(delay)
+            self.stats.backoffTime += time.perf_counter() - start
+            delay = min(delay * 2, self.maxReconnectDelay)
+
+    def close(self):
+        if self.ser is not None:
+            try:
+                self.ser.close()
+            except (serial.SerialException, OSError):
+                pass
+            self.ser = None
+
     def sendPackage(self, package: Package) -> Package:
         data: bytes = package.getBytes() + SERIAL_TERMINATOR
+        return self._transact(lambda timeout: self._exchange(data, timeout))
 
-        with serial.Serial(self.serialDevice, self.baudrate, timeout=self.timeout) as ser:
-            self.log.debug(f" --> {data.hex()}")
-            ser.write(data)
+    def _exchange(self, data: bytes, timeout: float) -> Package:
+        try:
+            response = self._transfer(data, timeout)
+        except TimeoutError:
+            raise
+        except (serial.SerialException, OSError) as e:
+            # port vanished (USB disconnect), reopen it and try once more
+            self.log.warning(f"serial session lost ({e}), reopening {self.serialDevice}")
+            self.close()
+            self.stats.reconnects += 1
+            response = self._transfer(data, timeout)
 
-            response: bytes = ser.read_until(SERIAL_TERMINATOR, size=MSG_MAX_LENGTH)
-            self.log.debug(f" <-- {response.hex()}")
-            assert len(response) > 0, "got empty response"
+        if not response.endswith(SERIAL_TERMINATOR):
+            raise TimeoutError("no response from Xcom-232i")
 
         retPackage = Package.parseBytes(response[:-len(SERIAL_TERMINATOR)])
         self.log.debug(retPackage)
@@ -38,3 +131,47 @@ class XcomRS232(XcomAbs):
             raise KeyError("Error received", err)
 
         return retPackage
+
+    def _transfer(self, data: bytes, timeout: float) -> bytes:
+        self.open()
+
+        start = time.perf_counter()
+        try:
+            # drop stale bytes left over from a previous timed out request
+            self.ser.reset_input_buffer()
+
+            self.log.debug(f" --> {data.hex()}")
+            self.ser.write(data)
+            # the port timeout is left alone, setting it reconfigures the
+            # port, the whole response has to arrive before this deadline
+            deadline = time.monotonic() + timeout
+
+            # framed by the length in the header, a payload (a float value,
+            # a message) may contain the terminator
+            response: bytes = self._read(1 + Header.length, deadline)
+            length = Package.packageLength(response)
+            if length is not None:
+                response += self._read(length - len(response) + len(SERIAL_TERMINATOR), deadline)
+            self.log.debug(f" <-- {response.hex()}")
+        finally:
+            self.stats.ioTime += time.perf_counter() - start
+            self.stats.requests += 1
+
+        return response
+
+    def _read(self, size: int, deadline: float) -> bytes:
+        """Up to size bytes, fewer if they did not all arrive before deadline"""
+        data = b""
+        while len(data) < size:
+            waiting = self.ser.in_waiting
+            if waiting:
+                # never blocks, the bytes are already there
+                data += self.ser.read(min(waiting, size - len(data)))
+                continue
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(POLL_INTERVAL, remaining))
+
+        return data
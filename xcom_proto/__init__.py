@@ -1,4 +1,9 @@
 from .parameters import Dataset as XcomP
 from . import parameters as XcomC
 from .XcomRS232 import XcomRS232
-from .XcomLAN import XcomLANTCP, XcomLANUDP
\ No newline at end of file
+from .XcomLAN import XcomLANTCP, XcomLANUDP
+from .scheduler import PollEntry, PollScheduler
+from .retransmission import CircuitOpenError
+from .datalog import Message, MessageLog
+from .snapshot import Snapshot, diffSnapshots
+from .XcomAsync import AsyncXcomAbs, AsyncXcomRS232, AsyncXcomLANTCP, AsyncXcomLANUDP
@@ -0,0 +1,96 @@
+##
+# Bulk retrieval of the event log of the RCC / Xcom (message objects of the
+# Xcom protocol), mirrored in a JSON lines file
+##
+
+import os
+import json
+import struct
+import logging
+
+from dataclasses import dataclass, asdict
+from datetime import datetime, timezone
+
+# the event log is held by the RCC / Xcom gateway
+LOG_ADDR = 501
+
+# total messages in the log, message id, source address, timestamp, value
+MESSAGE_STRUCT = struct.Struct("<IHIII")
+
+@dataclass
+class Message:
+    index: int
+    total: int          # messages in the log when this one was read
+    messageId: int      # number of the message in the Studer message list
+    source: int         # address of the device which sent it
+    timestamp: datetime # clock of the installation, no time zone
+    value: int
+
+    @staticmethod
+    def unpack(index: int, data: bytes):
+        total, messageId, source, timestamp, value = MESSAGE_STRUCT.unpack_from(data)
+        timestamp = datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+        return Message(index, total, messageId, source, timestamp, value)
+
+def sameMessage(message: Message, stored: dict) -> bool:
+    """Whether a message read is the one stored in messages.jsonl"""
+    return (message.messageId, message.source, str(message.timestamp)) \
+        == (stored["messageId"], stored["source"], stored["timestamp"])
+
+class MessageLog:
+
+    def __init__(self, xcom, directory: str, dstAddr=LOG_ADDR):
+        """
+        Mirror of the event log in `directory`/messages.jsonl. The next
+        sync starts after the last message stored, or reads the whole log
+        again when the device no longer has that message at its index (log
+        wrapped or cleared).
+        """
+
+        self.xcom = xcom
+        self.directory = directory
+        self.dstAddr = dstAddr
+        self.log = logging.getLogger("MessageLog")
+
+        os.makedirs(directory, exist_ok=True)
+
+    def syncMessages(self) -> list[Message]:
+        """Read the messages logged since the last sync and append them to messages.jsonl"""
+        path = os.path.join(self.directory, "messages.jsonl")
+
+        last = None
+        if os.path.exists(path):
+            with open(path, "rb+") as f:
+                # a line cut by an interruption is dropped and read again
+                data = f.read()
+                end = data.rfind(b"\n") + 1
+                f.truncate(end)
+                lines = data[:end].splitlines()
+                if lines:
+                    last = json.loads(lines[-1])
+
+        start = 0
+        if last is not None:
+            start = last["index"] + 1
+            try:
+                current = self.xcom.getMessage(last["index"], self.dstAddr)
+            except KeyError as e:
+                if e.args[-1] != "OBJECT_ID_NOT_FOUND":
+                    raise
+                current = None
+
+            if current is None or not sameMessage(current, last):
+                self.log.warning("event log wrapped or cleared, reading it again")
+                start = 0
+
+        messages = self.xcom.getMessages(start, dstAddr=self.dstAddr)
+        if last is not None and start == 0:
+            # only the messages logged after the last one stored
+            after = datetime.fromisoformat(last["timestamp"])
+            messages = [m for m in messages if m.timestamp > after]
+
+        with open(path, "a") as f:
+            for message in messages:
+                f.write(json.dumps(asdict(message), default=str) + "\n")
+
+        return messages
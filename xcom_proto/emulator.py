@@ -0,0 +1,464 @@
+#! /usr/bin/env python3
+
+##
+# Emulator of an Xcom gateway (Xcom-232i or Xcom-LAN) and the devices behind
+# it, to test and benchmark without a real installation:
+#
+#   python -m xcom_proto.emulator --pty --udp 4002 --tcp 4001 --latency 0.05
+##
+
+import os
+import pty
+import tty
+import math
+import time
+import queue
+import random
+import socket
+import logging
+import argparse
+import threading
+
+from .protocol import Package
+from .parameters import *
+from .XcomAbs import MSG_MAX_LENGTH
+from .datalog import LOG_ADDR, MESSAGE_STRUCT
+from .XcomRS232 import SERIAL_TERMINATOR
+
+# error codes by name
+ERRORS = {name: code for code, name in ERROR_CODES.items()}
+
+# (base, amplitude) of the simulated value of a float datapoint, by unit
+SIMULATED_RANGES = {
+    "A":    (10, 8),
+    "W":    (1500, 1000),
+    "kW":   (1.5, 1.0),
+    "Hz":   (50, 0.05),
+    "%":    (80, 10),
+    "°C":   (30, 5),
+}
+
+# counters, (initial value, increase per hour)
+SIMULATED_COUNTERS = {
+    "kWh":  (5, 1.5),
+    "MWh":  (2, 0.0015),
+    "Ah":   (40, 20),
+    "h":    (1000, 1),
+    "d":    (100, 1 / 24),
+}
+
+def simulateValue(datapoint: Datapoint, unit: int, elapsed: float):
+    """Plausible value of a datapoint of the `unit`th device (0 based), `elapsed` seconds after start"""
+    if datapoint.type == TYPE_BOOL:
+        return False
+    if datapoint.type in (TYPE_SINT, TYPE_SHORT_ENUM, TYPE_LONG_ENUM):
+        return 0
+    if datapoint.type != TYPE_FLOAT:
+        return b"" if datapoint.type == TYPE_BYTES else ""
+
+    if datapoint.unit in SIMULATED_COUNTERS:
+        start, rate = SIMULATED_COUNTERS[datapoint.unit]
+        return start + rate * elapsed / 3600
+
+    if datapoint.unit == "V":
+        if "AC" in datapoint.name:
+            base, amplitude = 230, 3
+        elif "PV" in datapoint.name:
+            base, amplitude = 80, 20
+        else:
+            base, amplitude = 51.5, 1.5
+    else:
+        base, amplitude = SIMULATED_RANGES.get(datapoint.unit, (1, 0))
+
+    # slow oscillation, shifted for every unit
+    return base + amplitude * math.sin(elapsed / 60 + unit)
+
+class XcomEmulator:
+
+    def __init__(self, devices: dict[str, list[int]] = None, latency=0.02, jitter=0.0,
+            dropRate=0.0, busyRate=0.0, junkRate=0.0, seed: int = None, messages=20,
+            noMulticast: set[int] = None):
+        """
+        Answers PROPERTY_READ and PROPERTY_WRITE of the Dataset datapoints for
+        the units listed in `devices` (one of each type by default). The RCC
+        (address 501) holds an event log of `messages` messages. Reads of
+        the datapoints in `noMulticast` at a multicast address are refused
+        with SCOM_ERROR_MULTICAST_READ_NOT_SUPPORTED.
+
+        Every request takes `latency` +- `jitter` seconds on the simulated
+        bus. A request is silently dropped with probability `dropRate`,
+        answered with SCOM_ERROR_GATEWAY_BUSY with probability `busyRate`,
+        and on TCP preceded by an unrelated package (like the MOXA does) with
+        probability `junkRate`.
+        """
+
+        self.devices = devices or {
+            DEVICE_XTENDER: [101],
+            DEVICE_BSP: [601],
+            DEVICE_VARIOTRACK: [301],
+            DEVICE_VARIOSTRING: [701],
+        }
+        self.latency = latency
+        self.jitter = jitter
+        self.dropRate = dropRate
+        self.busyRate = busyRate
+        self.junkRate = junkRate
+        self.noMulticast = noMulticast or set()
+        self.random = random.Random(seed)
+        self.log = logging.getLogger("XcomEmulator")
+
+        self.requests = 0
+        self.dropped = 0
+        self.busy = 0
+        self.junk = 0
+        self.flashWrites = 0
+
+        # written parameter values, (address, object id) -> value
+        self.written: dict[tuple[int, int], object] = dict()
+
+        # event log, (message id, source address, timestamp, value)
+        now = int(time.time())
+        sources = [a for units in self.devices.values() for a in units] or [LOG_ADDR]
+        self.messages = [(self.random.choice((0, 20, 22, 82, 170)), self.random.choice(sources),
+            now - (messages - i) * 3600, 0) for i in range(messages)]
+
+        self._start = time.monotonic()
+        self._running = True
+        self._threads: list[threading.Thread] = list()
+        self._closeables: list = list()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, error_type, error, traceback) -> bool:
+        self.close()
+        return False
+
+    def close(self):
+        self._running = False
+        for c in self._closeables:
+            try:
+                c.close()
+            except OSError:
+                pass
+        for t in self._threads:
+            t.join(1)
+
+    ## devices
+
+    def _units(self, dstAddr: int, deviceType: str) -> list[int]:
+        """Addressed units of the device type, empty if there is none at that address"""
+        units = self.devices.get(deviceType, [])
+        if dstAddr == DEVICE_DEFAULT_ADDR[deviceType] and dstAddr not in DEVICE_ADDR_RANGES[deviceType]:
+            return units
+        return [dstAddr] if dstAddr in units else []
+
+    def _readValue(self, datapoint: Datapoint, units: list[int]):
+        elapsed = time.monotonic() - self._start
+        deviceType = getDeviceType(datapoint.id)
+
+        values = list()
+        for addr in units:
+            if (addr, datapoint.id) in self.written:
+                values.append(self.written[(addr, datapoint.id)])
+            else:
+                values.append(simulateValue(datapoint, self.devices[deviceType].index(addr), elapsed))
+
+        return aggregateValues(datapoint, values)
+
+    def _readLimit(self, datapoint: Datapoint, propertyID: bytes) -> bytes:
+        if propertyID == QSP_LEVEL:
+            return QSP_LEVEL_EXPERT
+        if propertyID == QSP_MIN:
+            return datapoint.packValue(0)
+        return datapoint.packValue(1 if datapoint.type == TYPE_BOOL else 1000)
+
+    def respond(self, request: Package, data: bytes, error=False) -> Package:
+        response = Package.genPackage(
+            service_id=request.frame_data.service_id,
+            object_id=request.frame_data.service_data.object_id,
+            object_type=request.frame_data.service_data.object_type,
+            property_id=request.frame_data.service_data.property_id,
+            property_data=data,
+            src_addr=request.header.dst_addr,
+            dst_addr=request.header.src_addr
+        )
+        response.frame_data.service_flags = 3 if error else 2
+        return response
+
+    def error(self, request: Package, name: str) -> Package:
+        return self.respond(request, ERRORS[name], error=True)
+
+    def handle(self, request: Package) -> Package:
+        """Response to a request, None if it is dropped"""
+        self.requests += 1
+
+        if self.random.random() < self.dropRate:
+            self.dropped += 1
+            return None
+        if self.random.random() < self.busyRate:
+            self.busy += 1
+            return self.error(request, "SCOM_ERROR_GATEWAY_BUSY")
+
+        service = request.frame_data.service_data
+        if service.object_type == TYPE_MESSAGE:
+            return self._handleLog(request)
+
+        try:
+            deviceType = getDeviceType(service.object_id)
+        except UnknownDatapointException:
+            return self.error(request, "OBJECT_ID_NOT_FOUND")
+
+        units = self._units(request.header.dst_addr, deviceType)
+        if not units:
+            return self.error(request, "DEVICE_NOT_FOUND")
+
+        try:
+            datapoint = Dataset.getParamByID(service.object_id)
+        except UnknownDatapointException:
+            return self.error(request, "OBJECT_ID_NOT_FOUND")
+
+        if request.frame_data.service_id == PROPERTY_READ:
+            if datapoint.id in self.noMulticast and request.header.dst_addr not in units:
+                return self.error(request, "SCOM_ERROR_MULTICAST_READ_NOT_SUPPORTED")
+            if service.object_type == TYPE_PARAMETER and service.property_id in (QSP_MIN, QSP_MAX, QSP_LEVEL):
+                return self.respond(request, self._readLimit(datapoint, service.property_id))
+            return self.respond(request, datapoint.packValue(self._readValue(datapoint, units)))
+
+        if request.frame_data.service_id == PROPERTY_WRITE:
+            if service.object_type != TYPE_PARAMETER:
+                return self.error(request, "PROPERTY_IS_READ_ONLY")
+
+            value = datapoint.unpackValue(service.property_data)
+            for addr in units:
+                self.written[(addr, datapoint.id)] = value
+            if service.property_id == QSP_VALUE:
+                self.flashWrites += 1
+            return self.respond(request, b"")
+
+        return self.error(request, "SERVICE_NOT_SUPPORTED")
+
+    ## event log of the RCC
+
+    def _handleLog(self, request: Package) -> Package:
+        service = request.frame_data.service_data
+        if request.header.dst_addr != LOG_ADDR:
+            return self.error(request, "DEVICE_NOT_FOUND")
+        if request.frame_data.service_id != PROPERTY_READ:
+            return self.error(request, "PROPERTY_IS_READ_ONLY")
+
+        if not 0 <= service.object_id < len(self.messages):
+            return self.error(request, "OBJECT_ID_NOT_FOUND")
+        return self.respond(request, MESSAGE_STRUCT.pack(len(self.messages), *self.messages[service.object_id]))
+
+    def unrelated(self) -> Package:
+        """Package unrelated to any pending request"""
+        request = Package.genPackage(PROPERTY_READ, 3000, TYPE_INFO, QSP_VALUE, b"", dst_addr=101)
+        return self.respond(request, b"\x00\x00\x00\x00")
+
+    def busDelay(self) -> float:
+        return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    def _spawn(self, target, *args):
+        t = threading.Thread(target=target, args=args, daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    ## frontends
+
+    def servePty(self) -> str:
+        """Serial line of an Xcom-232i, returns the device name to open with XcomRS232"""
+        master, slave = pty.openpty()
+        tty.setraw(slave)
+        name = os.ttyname(slave)
+
+        self._closeables.append(_FileDescriptor(master))
+        self._closeables.append(_FileDescriptor(slave))
+        self._spawn(self._ptyLoop, master)
+
+        self.log.info(f"serial emulator on {name}")
+        return name
+
+    def _ptyLoop(self, master: int):
+        buffer = b""
+        while self._running:
+            try:
+                buffer += os.read(master, 512)
+            except OSError:
+                return
+
+            while True:
+                # resynchronize on the start byte, then frame by length
+                start = buffer.find(Package.start_byte)
+                buffer = buffer[start:] if start >= 0 else b""
+                length = Package.packageLength(buffer)
+                if length is None or len(buffer) < length + len(SERIAL_TERMINATOR):
+                    break
+
+                line, buffer = buffer[:length], buffer[length + len(SERIAL_TERMINATOR):]
+                response = self._handleBytes(line)
+                if response is not None:
+                    try:
+                        os.write(master, response.getBytes() + SERIAL_TERMINATOR)
+                    except OSError:
+                        # closed by close() while handling the request
+                        return
+
+    def serveUDP(self, port=4002, replyPort=4001, host="127.0.0.1") -> int:
+        """
+        Xcom-LAN in UDP mode, answers to the port of the sender's IP set up
+        in the Xcom-LAN (`replyPort`), not to the source port of the request
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((host, port))
+        self._closeables.append(sock)
+
+        # requests share a single bus, they are answered one after the other
+        requests = queue.Queue()
+        self._spawn(self._udpReceiveLoop, sock, requests)
+        self._spawn(self._udpBusLoop, sock, requests, replyPort)
+
+        self.log.info(f"UDP emulator on {host}:{sock.getsockname()[1]}")
+        return sock.getsockname()[1]
+
+    def _udpReceiveLoop(self, sock: socket.socket, requests: queue.Queue):
+        while self._running:
+            try:
+                data, addr = sock.recvfrom(MSG_MAX_LENGTH)
+            except OSError:
+                requests.put(None)
+                return
+            requests.put((data, addr))
+
+    def _udpBusLoop(self, sock: socket.socket, requests: queue.Queue, replyPort: int):
+        while (item := requests.get()) is not None:
+            data, addr = item
+            response = self._handleBytes(data)
+            if response is not None:
+                try:
+                    sock.sendto(response.getBytes(), (addr[0], replyPort))
+                except OSError:
+                    return
+
+    def serveTCP(self, port=4001, host="127.0.0.1"):
+        """MOXA of an Xcom-LAN in TCP mode, it connects to the server started by XcomLANTCP"""
+        self._spawn(self._tcpLoop, host, port)
+
+    def _tcpLoop(self, host: str, port: int):
+        # wait for the server to be started
+        while self._running:
+            try:
+                conn = socket.create_connection((host, port), timeout=1)
+                break
+            except OSError:
+                time.sleep(0.1)
+        else:
+            return
+
+        conn.settimeout(None)
+        # an unrelated package and the answer are two writes, the answer must
+        # not wait for the acknowledgement of the first one (Nagle)
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._closeables.append(conn)
+        self.log.info(f"TCP emulator connected to {host}:{port}")
+
+        buffer = b""
+        while self._running:
+            try:
+                data = conn.recv(MSG_MAX_LENGTH)
+            except OSError:
+                return
+            if not data:
+                return
+            buffer += data
+
+            while True:
+                # a stream: resynchronize on the start byte, then frame by length
+                start = buffer.find(Package.start_byte)
+                buffer = buffer[start:] if start >= 0 else b""
+                length = Package.packageLength(buffer)
+                if length is None or len(buffer) < length:
+                    break
+
+                request, buffer = buffer[:length], buffer[length:]
+                response = self._handleBytes(request)
+                if response is None:
+                    continue
+
+                try:
+                    if self.random.random() < self.junkRate:
+                        # the answer still follows the unrelated package
+                        self.junk += 1
+                        conn.sendall(self.unrelated().getBytes())
+                    conn.sendall(response.getBytes())
+                except OSError:
+                    return
+
+    def _handleBytes(self, data: bytes) -> Package:
+        try:
+            request = Package.parseBytes(data)
+        except AssertionError as e:
+            self.log.debug(f"invalid request {data.hex()}: {e}")
+            return None
+
+        time.sleep(self.busDelay())
+        return self.handle(request)
+
+    def __str__(self) -> str:
+        return (f"XcomEmulator(requests={self.requests}, dropped={self.dropped}, "
+            f"busy={self.busy}, junk={self.junk}, flashWrites={self.flashWrites})")
+
+class _FileDescriptor:
+
+    def __init__(self, fd: int):
+        self.fd = fd
+
+    def close(self):
+        os.close(self.fd)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Emulates an Xcom gateway and its devices")
+    parser.add_argument("--pty", action="store_true", help="serial line (prints the pty to open)")
+    parser.add_argument("--udp", type=int, metavar="PORT", help="Xcom-LAN UDP port")
+    parser.add_argument("--udp-reply", type=int, default=4001, metavar="PORT", help="port the UDP responses are sent to")
+    parser.add_argument("--tcp", type=int, metavar="PORT", help="connect to an XcomLANTCP server on this port")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--xtender", type=int, default=1, help="number of Xtenders")
+    parser.add_argument("--variotrack", type=int, default=1, help="number of VarioTracks")
+    parser.add_argument("--variostring", type=int, default=1, help="number of VarioStrings")
+    parser.add_argument("--no-bsp", action="store_true")
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--drop", type=float, default=0.0, help="probability of a dropped request")
+    parser.add_argument("--busy", type=float, default=0.0, help="probability of SCOM_ERROR_GATEWAY_BUSY")
+    parser.add_argument("--junk", type=float, default=0.0, help="probability of unrelated data on TCP")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--messages", type=int, default=20, help="messages in the event log")
+    parser.add_argument("--no-multicast", type=int, nargs="*", default=[], metavar="ID",
+        help="datapoints which cannot be read at a multicast address")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    devices = {
+        DEVICE_XTENDER: list(DEVICE_ADDR_RANGES[DEVICE_XTENDER][:args.xtender]),
+        DEVICE_BSP: [] if args.no_bsp else [601],
+        DEVICE_VARIOTRACK: list(DEVICE_ADDR_RANGES[DEVICE_VARIOTRACK][:args.variotrack]),
+        DEVICE_VARIOSTRING: list(DEVICE_ADDR_RANGES[DEVICE_VARIOSTRING][:args.variostring]),
+    }
+
+    with XcomEmulator(devices, args.latency, args.jitter, args.drop, args.busy, args.junk, args.seed,
+            args.messages, set(args.no_multicast)) as emulator:
+        if args.pty:
+            print(emulator.servePty(), flush=True)
+        if args.udp:
+            emulator.serveUDP(args.udp, args.udp_reply, args.host)
+        if args.tcp:
+            emulator.serveTCP(args.tcp, args.host)
+
+        try:
+            while True:
+                time.sleep(10)
+                emulator.log.info(emulator)
+        except KeyboardInterrupt:
+            pass
@@ -5,16 +5,18 @@
 ##
 
 import struct
-from dataclasses import dataclass
 
 
 class UnknownDatapointException(Exception):
     pass
 
-@dataclass
 class ValueTuple:
-    id: int
-    value: str
+
+    __slots__ = ("id", "value")
+
+    def __init__(self, id: int, value: str):
+        self.id = id
+        self.value = value
 
     def __eq__(self, __o: object) -> bool:
         if __o.__class__ is self.__class__:
@@ -26,15 +28,37 @@ class ValueTuple:
             return __o.id != self.id
         return __o != self.id
 
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+    def __repr__(self) -> str:
+        return f"ValueTuple(id={self.id!r}, value={self.value!r})"
+
     def __str__(self) -> str:
         return self.value
 
-@dataclass
 class Datapoint:
-    id: int
-    name: str
-    type: str
-    unit: str = ""
+    """
+    The struct codec of the datatype is looked up once when the datapoint is
+    created (or its type changed) instead of on every value.
+    """
+
+    __slots__ = ("id", "name", "_type", "unit", "_unpacker", "_packer")
+
+    def __init__(self, id: int, name: str, type: str, unit: str = ""):
+        self.id = id
+        self.name = name
+        self.type = type
+        self.unit = unit
+
+    @property
+    def type(self) -> str:
+        return self._type
+
+    @type.setter
+    def type(self, type: str):
+        self._type = type
+        self._unpacker, self._packer = _CODECS.get(type, (None, None))
 
     def __eq__(self, __o: object) -> bool:
         if __o.__class__ is self.__class__:
@@ -46,38 +70,36 @@ class Datapoint:
             return __o.id != self.id
         return __o != self.id
 
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+    def __repr__(self) -> str:
+        return f"Datapoint(id={self.id!r}, name={self.name!r}, type={self.type!r}, unit={self.unit!r})"
+
     def unpackValue(self, value: bytes):
-        if self.type is TYPE_FLOAT:
-            return struct.unpack("<f", value)[0]
-        if self.type is TYPE_SINT:
-            return struct.unpack("<i", value)[0]
-        if self.type is TYPE_BOOL:
-            return struct.unpack("<?", value)[0]
-        if self.type is TYPE_SHORT_ENUM:
-            return struct.unpack("<h", value)[0]
-        if self.type is TYPE_LONG_ENUM:
-            return struct.unpack("<I", value)[0]
-        if self.type is TYPE_STRING:
-            return value.decode("iso8859-15")
-        if self.type is TYPE_BYTES:
+        if self._unpacker is not None:
+            return self._unpacker.unpack(value)[0]
+        if self.type == TYPE_STRING:
+            return bytes(value).decode("iso8859-15")
+        if self.type == TYPE_BYTES:
             return value
 
         raise TypeError("Unknown datatype", self)
 
+    def unpackValues(self, values: list[bytes]) -> list:
+        """Decode many raw payloads of this datapoint at once"""
+        if self._unpacker is not None:
+            unpack = self._unpacker.unpack
+            return [unpack(v)[0] for v in values]
+
+        return [self.unpackValue(v) for v in values]
+
     def packValue(self, value) -> bytes:
-        if self.type is TYPE_FLOAT:
-            return struct.pack("<f", value)
-        if self.type is TYPE_SINT:
-            return struct.pack("<i", value)
-        if self.type is TYPE_BOOL:
-            return struct.pack("<?", value)
-        if self.type is TYPE_SHORT_ENUM:
-            return struct.pack("<H", value)
-        if self.type is TYPE_LONG_ENUM:
-            return struct.pack("<I", value)
-        if self.type is TYPE_STRING:
+        if self._packer is not None:
+            return self._packer.pack(value)
+        if self.type == TYPE_STRING:
             return str(value).encode("iso8859-15")
-        if self.type is TYPE_BYTES:
+        if self.type == TYPE_BYTES:
             return bytes(value)
 
         raise TypeError("Unknown datatype", self)
@@ -87,6 +109,11 @@ class Datapoint:
         dataPoint = Dataset.getParamByID(id)
         return dataPoint.unpackValue(value)
 
+    @staticmethod
+    def unpackValuesByID(ids: list[int], values: list[bytes]) -> list:
+        getParamByID = Dataset.registry().getByID
+        return [getParamByID(id).unpackValue(v) for id, v in zip(ids, values)]
+
 
 ### data types
 TYPE_BOOL       = "BOOL"
@@ -97,6 +124,16 @@ TYPE_LONG_ENUM  = "ENUM_LONG"
 TYPE_STRING     = "STRING"
 TYPE_BYTES      = "BYTES"
 
+# (unpack, pack) codec of each fixed size datatype, enums are read signed
+# but written unsigned
+_CODECS = {
+    TYPE_FLOAT:      (struct.Struct("<f"), struct.Struct("<f")),
+    TYPE_SINT:       (struct.Struct("<i"), struct.Struct("<i")),
+    TYPE_BOOL:       (struct.Struct("<?"), struct.Struct("<?")),
+    TYPE_SHORT_ENUM: (struct.Struct("<h"), struct.Struct("<H")),
+    TYPE_LONG_ENUM:  (struct.Struct("<I"), struct.Struct("<I")),
+}
+
 ### service_id
 PROPERTY_READ   = b'\x01'
 PROPERTY_WRITE  = b'\x02'
@@ -115,6 +152,9 @@ QSP_MAX             = b'\x07\x00'
 QSP_LEVEL           = b'\x08\x00'
 QSP_UNSAVED_VALUE   = b'\x0D\x00'
 
+## property_id of the message objects
+MESSAGE_READ        = b'\x00\x00'   # object_id: index of the message in the event log
+
 ## values for QSP_LEVEL
 QSP_LEVEL_VIEW_ONLY     = b'\x00\x00'
 QSP_LEVEL_BASIC         = b'\x10\x00'
@@ -123,6 +163,59 @@ QSP_LEVEL_INSTALLER     = b'\x30\x00'
 QSP_LEVEL_QSP           = b'\x40\x00'
 
 
+### device types, by object id range (parameters / infos)
+DEVICE_XTENDER      = "xtender"         # 1000-1999 / 3000-3999
+DEVICE_RCC          = "rcc"             # 5000-5999
+DEVICE_BSP          = "bsp"             # 6000-6999 / 7000-7999
+DEVICE_VARIOTRACK   = "variotrack"      # 10000-10999 / 11000-11999
+DEVICE_VARIOSTRING  = "variostring"     # 14000-14999 / 15000-15999
+
+def getDeviceType(id: int) -> str:
+    if 1000 <= id < 2000 or 3000 <= id < 4000:
+        return DEVICE_XTENDER
+    if 5000 <= id < 6000:
+        return DEVICE_RCC
+    if 6000 <= id < 8000:
+        return DEVICE_BSP
+    if 10000 <= id < 12000:
+        return DEVICE_VARIOTRACK
+    if 14000 <= id < 16000:
+        return DEVICE_VARIOSTRING
+
+    raise UnknownDatapointException(id)
+
+# multicast / single address of each device type
+DEVICE_DEFAULT_ADDR = {
+    DEVICE_XTENDER:     100,
+    DEVICE_RCC:         501,
+    DEVICE_BSP:         601,
+    DEVICE_VARIOTRACK:  300,
+    DEVICE_VARIOSTRING: 700,
+}
+
+# addresses of the individual units
+DEVICE_ADDR_RANGES = {
+    DEVICE_XTENDER:     range(101, 110),
+    DEVICE_RCC:         range(501, 502),
+    DEVICE_BSP:         range(601, 602),
+    DEVICE_VARIOTRACK:  range(301, 316),
+    DEVICE_VARIOSTRING: range(701, 716),
+}
+
+def getDefaultAddress(id: int) -> int:
+    return DEVICE_DEFAULT_ADDR[getDeviceType(id)]
+
+# values of all units added up by a multicast read, the others are the
+# value of the first unit
+ADDITIVE_UNITS = ("A", "W", "kW", "kWh", "MWh", "Ah")
+
+def aggregateValues(datapoint: Datapoint, values: list):
+    """Value of a group of units, the way a multicast read returns it"""
+    if datapoint.type == TYPE_FLOAT and datapoint.unit in ADDITIVE_UNITS:
+        return sum(values)
+    return values[0]
+
+
 ### operating modes (11016)
 MODE_NIGHT      = ValueTuple(0, "MODE_NIGHT")
 MODE_STARTUP    = ValueTuple(1, "MODE_STARTUP")
@@ -311,17 +404,99 @@ class Dataset:
 
     @staticmethod
     def getParamByID(id: int) -> Datapoint:
-        for point in Dataset._getDatapoints():
-            if point == id:
-                return point
+        return Dataset.registry().getByID(id)
 
-        raise UnknownDatapointException(id)
+    @staticmethod
+    def getParamsByID(id: int) -> list[Datapoint]:
+        return Dataset.registry().getAllByID(id)
+
+    @staticmethod
+    def getParamByName(name: str) -> Datapoint:
+        return Dataset.registry().getByName(name)
+
+    @staticmethod
+    def getParamByTopic(topic: str) -> Datapoint:
+        return Dataset.registry().getByTopic(topic)
+
+    @staticmethod
+    def registry() -> "DatapointRegistry":
+        global _registry
+        if _registry is None:
+            _registry = DatapointRegistry.fromClass(Dataset)
+        return _registry
 
     @staticmethod
     def _getDatapoints() -> list[Datapoint]:
-        points = list()
-        for val in Dataset.__dict__.values():
+        return list(Dataset.registry())
+
+class DatapointRegistry:
+    """
+    Indexes of the datapoints by id, by name and by MQTT topic.
+
+    Several names can share an id, getByID returns the first one registered
+    and getAllByID all of them. Names are indexed both by attribute name and
+    by Datapoint.name, topics by their last path component which defaults
+    to the lower case attribute name (home/sensor/ac_power_out).
+    """
+
+    def __init__(self):
+        self._points: list[Datapoint] = list()
+        self._byID: dict[int, list[Datapoint]] = dict()
+        self._byName: dict[str, Datapoint] = dict()
+        self._byTopic: dict[str, Datapoint] = dict()
+
+    @staticmethod
+    def fromClass(cls) -> "DatapointRegistry":
+        registry = DatapointRegistry()
+        for name, val in cls.__dict__.items():
             if type(val) is Datapoint:
-                points.append(val)
+                registry.register(val, name)
+
+        return registry
+
+    def register(self, point: Datapoint, name: str = None):
+        name = name or point.name
+
+        self._points.append(point)
+        self._byID.setdefault(point.id, list()).append(point)
+        self._byName.setdefault(name, point)
+        self._byName.setdefault(point.name, point)
+        self._byTopic.setdefault(name.lower(), point)
+
+    def registerTopic(self, topic: str, point: Datapoint):
+        self._byTopic[topic] = point
+
+    def getByID(self, id: int) -> Datapoint:
+        try:
+            return self._byID[id][0]
+        except KeyError:
+            raise UnknownDatapointException(id) from None
+
+    def getAllByID(self, id: int) -> list[Datapoint]:
+        return list(self._byID.get(id, ()))
+
+    def getByName(self, name: str) -> Datapoint:
+        try:
+            return self._byName[name]
+        except KeyError:
+            raise UnknownDatapointException(name) from None
+
+    def getByTopic(self, topic: str) -> Datapoint:
+        point = self._byTopic.get(topic) or self._byTopic.get(topic.rsplit("/", 1)[-1])
+        if point is None:
+            raise UnknownDatapointException(topic)
+        return point
+
+    def getSharedIDs(self) -> dict[int, list[Datapoint]]:
+        return {id: points for id, points in self._byID.items() if len(points) > 1}
+
+    def __iter__(self):
+        return iter(self._points)
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def __contains__(self, id: int) -> bool:
+        return id in self._byID
 
-        return points
+_registry: DatapointRegistry = None
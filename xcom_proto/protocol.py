@@ -1,14 +1,29 @@
 #! /usr/bin/env python3
 
 ##
-# Class implementing Xcom protocol 
+# Class implementing Xcom protocol
 ##
 
 import struct
-from io import BufferedWriter, BufferedReader, BytesIO
+from io import BufferedWriter, BufferedReader
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 from .parameters import ERROR_CODES
 
+##
+# precompiled wire layouts (little endian, no padding)
+##
+
+# frame_flags, src_addr, dst_addr, data_length
+HEADER_STRUCT = struct.Struct("<BIIH")
+# service_flags, service_id, object_type, object_id, property_id
+FRAME_STRUCT = struct.Struct("<Bc2sI2s")
+CHECKSUM_LENGTH = 2
+
 class Service:
 
     object_type: bytes
@@ -18,15 +33,15 @@ class Service:
 
     @staticmethod
     def parse(f: BufferedReader):
-        return Service(
-            f.read(2),
-            readUInt(f),
-            f.read(2),
-            f.read(-1)
-        )
+        return Service.parseBytes(f.read())
 
-    def __init__(self, 
-            object_type: bytes, object_id: int, 
+    @staticmethod
+    def parseBytes(buf: bytes):
+        object_type, object_id, property_id = struct.unpack_from("<2sI2s", buf)
+        return Service(object_type, object_id, property_id, bytes(buf[8:]))
+
+    def __init__(self,
+            object_type: bytes, object_id: int,
             property_id: bytes, property_data: bytes):
 
         assert len(object_type) == 2, "object_type length is not 2"
@@ -38,9 +53,7 @@ class Service:
         self.property_data = property_data
 
     def assemble(self, f: BufferedWriter):
-        f.write(self.object_type)
-        writeUInt(f, self.object_id)
-        f.write(self.property_id)
+        f.write(struct.pack("<2sI2s", self.object_type, self.object_id, self.property_id))
         f.write(self.property_data)
 
     def __len__(self) -> int:
@@ -57,15 +70,23 @@ class Frame:
 
     @staticmethod
     def parse(f: BufferedReader):
-        return Frame(
-            service_flags=readUChar(f),
-            service_id=f.read(1),
-            service_data=Service.parse(f)
-        )
+        return Frame.parseBytes(f.read())
 
     @staticmethod
     def parseBytes(buf: bytes):
-        return Frame.parse(BytesIO(buf))
+        return Frame.unpackFrom(buf, 0, len(buf))
+
+    @staticmethod
+    def unpackFrom(buf: bytes, offset: int, length: int):
+        service_flags, service_id, object_type, object_id, property_id = \
+            FRAME_STRUCT.unpack_from(buf, offset)
+
+        start = offset + FRAME_STRUCT.size
+        return Frame(
+            service_id=service_id,
+            service_data=Service(object_type, object_id, property_id, bytes(buf[start:offset + length])),
+            service_flags=service_flags
+        )
 
     def __init__(self, service_id: bytes, service_data: Service, service_flags=0):
         assert service_flags >= 0, "service_flag must not be negative"
@@ -76,14 +97,14 @@ class Frame:
         self.service_data = service_data
 
     def assemble(self, f: BufferedWriter):
-        writeUChar(f, self.service_flags)
-        f.write(self.service_id)
-        self.service_data.assemble(f)
+        f.write(self.getBytes())
 
     def getBytes(self) -> bytes:
-        buf = BytesIO()
-        self.assemble(buf)
-        return buf.getvalue()
+        service = self.service_data
+        return FRAME_STRUCT.pack(
+            self.service_flags, self.service_id,
+            service.object_type, service.object_id, service.property_id
+        ) + service.property_data
 
     def __len__(self) -> int:
         return 2*1 + len(self.service_data)
@@ -102,16 +123,16 @@ class Header:
 
     @staticmethod
     def parse(f: BufferedReader):
-        return Header(
-            frame_flags=readUChar(f),
-            src_addr=readUInt(f),
-            dst_addr=readUInt(f),
-            data_length=readUShort(f)
-        )
+        return Header.parseBytes(f.read(Header.length))
 
     @staticmethod
     def parseBytes(buf: bytes):
-        return Header.parse(BytesIO(buf))
+        return Header.unpackFrom(buf, 0)
+
+    @staticmethod
+    def unpackFrom(buf: bytes, offset: int):
+        frame_flags, src_addr, dst_addr, data_length = HEADER_STRUCT.unpack_from(buf, offset)
+        return Header(src_addr, dst_addr, data_length, frame_flags)
 
     def __init__(self, src_addr: int, dst_addr: int, data_length: int, frame_flags=0):
         assert frame_flags >= 0, "frame_flags must not be negative"
@@ -122,15 +143,10 @@ class Header:
         self.data_length = data_length
 
     def assemble(self, f: BufferedWriter):
-        writeUChar(f, self.frame_flags)
-        writeUInt(f, self.src_addr)
-        writeUInt(f, self.dst_addr)
-        writeUShort(f, self.data_length)
+        f.write(self.getBytes())
 
     def getBytes(self) -> bytes:
-        buf = BytesIO()
-        self.assemble(buf)
-        return buf.getvalue()
+        return HEADER_STRUCT.pack(self.frame_flags, self.src_addr, self.dst_addr, self.data_length)
 
     def __len__(self) -> int:
         return self.length
@@ -144,6 +160,8 @@ class Package:
     header: Header
     frame_data: Frame
 
+    _frozen: bytes = None
+
     @staticmethod
     def seekPackageStart(f: BufferedReader) -> bool:
         while b := f.read(1):
@@ -157,19 +175,53 @@ class Package:
         if not Package.seekPackageStart(f):
             raise AssertionError("empty or invalid package: package start byte not found")
 
-        h_raw = f.read(Header.length)
-        assert checksum(h_raw) == f.read(2), "invalid header checksum"
-        header = Header.parseBytes(h_raw)
+        h_raw = f.read(Header.length + CHECKSUM_LENGTH)
+        if len(h_raw) < Header.length:
+            raise AssertionError("invalid header checksum")
+        data_length = Header.unpackFrom(h_raw, 0).data_length
 
-        f_raw = f.read(header.data_length)
-        assert checksum(f_raw) == f.read(2), "invalid data checksum"
-        frame = Frame.parseBytes(f_raw)
+        return Package.unpackFrom(
+            Package.start_byte + h_raw + f.read(data_length + CHECKSUM_LENGTH), 0)
 
-        return Package(header, frame)
+    @staticmethod
+    def packageLength(buf: bytes, offset=0) -> int:
+        """Length of the package starting at buf[offset], None until its header was received"""
+        if len(buf) < offset + 1 + Header.length:
+            return None
+
+        data_length = HEADER_STRUCT.unpack_from(buf, offset + 1)[3]
+        return 1 + Header.length + CHECKSUM_LENGTH + data_length + CHECKSUM_LENGTH
 
     @staticmethod
     def parseBytes(buf: bytes):
-        return Package.parse(BytesIO(buf))
+        offset = buf.find(Package.start_byte)
+        if offset < 0:
+            raise AssertionError("empty or invalid package: package start byte not found")
+
+        return Package.unpackFrom(buf, offset)
+
+    @staticmethod
+    def unpackFrom(buf: bytes, offset: int):
+        """Decode the package starting with the start byte at buf[offset] in a single pass"""
+        view = memoryview(buf)
+
+        h_start = offset + 1
+        h_end = h_start + Header.length
+        if len(view) < h_end + CHECKSUM_LENGTH \
+                or checksum(view[h_start:h_end]) != view[h_end:h_end + CHECKSUM_LENGTH]:
+            raise AssertionError("invalid header checksum")
+        header = Header.unpackFrom(view, h_start)
+
+        f_start = h_end + CHECKSUM_LENGTH
+        f_end = f_start + header.data_length
+        if len(view) < f_end + CHECKSUM_LENGTH \
+                or checksum(view[f_start:f_end]) != view[f_end:f_end + CHECKSUM_LENGTH]:
+            raise AssertionError("invalid data checksum")
+        if header.data_length < FRAME_STRUCT.size:
+            raise AssertionError("invalid data length")
+        frame = Frame.unpackFrom(view, f_start, header.data_length)
+
+        return Package(header, frame)
 
     @staticmethod
     def genPackage(service_id: bytes,
@@ -179,9 +231,9 @@ class Package:
             property_data: bytes,
             src_addr = 1,
             dst_addr = 0):
-        
+
         frame = Frame(
-            service_id, 
+            service_id,
             Service(object_type, object_id, property_id, property_data)
         )
 
@@ -196,20 +248,22 @@ class Package:
         self.frame_data = frame_data
 
     def assemble(self, f: BufferedWriter):
-        f.write(self.start_byte)
+        f.write(self.getBytes())
 
-        header = self.header.getBytes()
-        f.write(header)
-        f.write(checksum(header))
+    def freeze(self):
+        """Encode once and return those bytes from getBytes, the package must not be modified anymore"""
+        self._frozen = None
+        self._frozen = self.getBytes()
+        return self
 
+    def getBytes(self) -> bytes:
+        if self._frozen is not None:
+            return self._frozen
+
+        header = self.header.getBytes()
         data = self.frame_data.getBytes()
-        f.write(data)
-        f.write(checksum(data))
 
-    def getBytes(self) -> bytes:
-        buf = BytesIO()
-        self.assemble(buf)
-        return buf.getvalue()
+        return b''.join((self.start_byte, header, checksum(header), data, checksum(data)))
 
     def isResponse(self) -> bool:
         return (self.frame_data.service_flags & 2) >> 1 == 1
@@ -224,7 +278,10 @@ class Package:
                 "UNKNOWN ERROR"
             )
         return None
- 
+
+    def __len__(self) -> int:
+        return 1 + Header.length + CHECKSUM_LENGTH + len(self.frame_data) + CHECKSUM_LENGTH
+
     def __str__(self) -> str:
         return f"Package(header={self.header}, frame_data={self.frame_data})"
 
@@ -232,17 +289,76 @@ class Package:
 
 def checksum(data: bytes) -> bytes:
     """Function to calculate the checksum needed for the header and the data"""
+    if len(data) > Fletcher.BLOCK_SIZE:
+        return Fletcher(data).digest()
+
+    # both sums are only needed modulo 256, reduce them once at the end
     A = 0xFF
     B = 0x00
 
     for d in data:
-        A = (A + d) % 0x100
-        B = (B + A) % 0x100
+        A += d
+        B += A
+
+    return bytes((A & 0xFF, B & 0xFF))
+
+class Fletcher:
+    """
+    Incremental Fletcher-16 variant used by Xcom, update() can be called with
+    the data in as many pieces as it arrives.
+
+    Both sums are only needed modulo 256, so the reduction is done once per
+    block instead of for every byte. Big payloads use NumPy when it is
+    installed.
+    """
+
+    __slots__ = ("A", "B")
 
-    A = struct.pack("<B", A)
-    B = struct.pack("<B", B)
+    BLOCK_SIZE = 1024           # keeps the running sums below 2**30
+    NUMPY_THRESHOLD = 4096
 
-    return A + B
+    def __init__(self, data: bytes = b''):
+        self.A = 0xFF
+        self.B = 0x00
+
+        if data:
+            self.update(data)
+
+    def update(self, data: bytes):
+        A = self.A
+        B = self.B
+        size = len(data)
+
+        if numpy is not None and size >= Fletcher.NUMPY_THRESHOLD:
+            values = numpy.frombuffer(data, dtype=numpy.uint8)
+            B += A * size + int(numpy.cumsum(values, dtype=numpy.uint64).sum(dtype=numpy.uint64) % 0x100)
+            A += int(values.sum(dtype=numpy.uint64) % 0x100)
+
+        elif size <= Fletcher.BLOCK_SIZE:
+            for d in data:
+                A += d
+                B += A
+
+        else:
+            view = memoryview(data)
+            for start in range(0, size, Fletcher.BLOCK_SIZE):
+                for d in view[start:start + Fletcher.BLOCK_SIZE]:
+                    A += d
+                    B += A
+                A &= 0xFF
+                B &= 0xFF
+
+        self.A = A & 0xFF
+        self.B = B & 0xFF
+
+    def digest(self) -> bytes:
+        return bytes((self.A, self.B))
+
+    def copy(self):
+        other = Fletcher()
+        other.A = self.A
+        other.B = self.B
+        return other
 
 ##
 
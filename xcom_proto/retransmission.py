@@ -0,0 +1,113 @@
+#! /usr/bin/env python3
+
+##
+# Adaptive timeouts, bounded retries and circuit breaker shared by all the
+# transports
+##
+
+import time
+import random
+import threading
+
+class CircuitOpenError(ConnectionError):
+    """Raised without sending anything while the gateway is considered offline"""
+    pass
+
+class RetransmissionTimer:
+
+    def __init__(self, initial=2.0, minTimeout=0.2, maxTimeout=2.0):
+        """
+        Round trip time estimate used to time out requests, as TCP does for
+        its retransmission timeout (RFC 6298): timeout = SRTT + 4 * RTTVAR,
+        kept within [minTimeout, maxTimeout] and doubled for every
+        retransmission of the same request. Only answers to requests which
+        were not retransmitted are sampled (Karn's algorithm), the timeout
+        starts at `initial` until the first sample.
+        """
+
+        self.minTimeout = minTimeout
+        self.maxTimeout = maxTimeout
+        self.srtt: float = None
+        self.rttvar: float = None
+        self.rto = min(max(initial, minTimeout), maxTimeout)
+
+        self.samples = 0
+        self.retransmissions = 0
+        self.timeouts = 0
+
+    def sample(self, rtt: float):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+
+        self.rto = min(max(self.srtt + 4 * self.rttvar, self.minTimeout), self.maxTimeout)
+        self.samples += 1
+
+    def timeout(self, attempt=0) -> float:
+        """Timeout of the `attempt`th transmission (0 for the first one) of a request"""
+        return min(self.rto * 2 ** attempt, self.maxTimeout)
+
+    def __str__(self) -> str:
+        srtt = "-" if self.srtt is None else f"{self.srtt * 1000:.1f}ms"
+        return (f"RetransmissionTimer(srtt={srtt}, rto={self.rto * 1000:.1f}ms, "
+                f"retransmissions={self.retransmissions}, timeouts={self.timeouts})")
+
+def retryDelay(attempt: int, base=0.05, cap=1.0) -> float:
+    """Pause before the `attempt`th retry (1 for the first one), exponential with full jitter"""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+class CircuitBreaker:
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, threshold=5, resetTime=30.0):
+        """
+        After `threshold` consecutive requests without any answer the
+        gateway is considered offline: requests fail immediately with
+        CircuitOpenError for `resetTime` seconds. Then a single request is
+        let through, an answer closes the circuit again, a timeout opens it
+        for another `resetTime` seconds.
+        """
+
+        self.threshold = threshold
+        self.resetTime = resetTime
+        self.state = self.CLOSED
+        self.failures = 0
+        self.openedAt = 0.0
+        self.rejected = 0
+
+        self._lock = threading.Lock()
+
+    def check(self):
+        """Raises CircuitOpenError if the request must not be sent"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+
+            if self.state == self.OPEN and time.monotonic() - self.openedAt >= self.resetTime:
+                # let a single trial request through
+                self.state = self.HALF_OPEN
+                return
+
+            self.rejected += 1
+            raise CircuitOpenError(f"gateway offline, circuit {self.state}")
+
+    def success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                self.state = self.OPEN
+                self.openedAt = time.monotonic()
+
+    def __str__(self) -> str:
+        return f"CircuitBreaker(state={self.state}, failures={self.failures}, rejected={self.rejected})"
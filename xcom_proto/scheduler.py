@@ -0,0 +1,187 @@
+#! /usr/bin/env python3
+
+##
+# Multi-rate polling scheduler driven by a polling profile
+##
+
+import time
+import logging
+import threading
+
+from dataclasses import dataclass, field
+from typing import Callable
+
+from .parameters import Datapoint, getDefaultAddress
+
+@dataclass
+class PollEntry:
+    datapoint: Datapoint
+    interval: float         # seconds between two reads
+    topic: str
+    priority: int = 0       # lower value is read first
+    scale: float = 1        # published value = round(value * scale) if != 1
+    dstAddr: int = None     # None reads from the default address of the device type
+    rule: object = None     # publishing rule of the bridge, None publishes every value
+
+    nextDue: float = field(default=0.0, compare=False, repr=False)
+
+    def __post_init__(self):
+        if self.dstAddr is None:
+            self.dstAddr = getDefaultAddress(self.datapoint.id)
+
+    def convert(self, value):
+        if self.scale != 1:
+            return round(float(value) * self.scale)
+        return float(value)
+
+class PollScheduler:
+
+    def __init__(self, entries: list[PollEntry], slot=1.0, busShare=0.8, readTime=0.05):
+        """
+        Time is divided into slots of `slot` seconds. In every slot the due
+        entries are sorted by priority and only as many reads as fit into
+        `busShare` of the slot are issued, using a running estimate of the
+        time a single read takes on the bus. Entries that do not fit stay due
+        and compete again in the next slot, so fast tiers are never starved
+        by a burst of slow counters.
+        """
+
+        self.entries = list(entries)
+        self.slot = slot
+        self.busShare = busShare
+        self.readTime = readTime
+        self.lastStepDuration = 0.0     # seconds spent reading during the last step
+        self.log = logging.getLogger("PollScheduler")
+
+        now = time.monotonic()
+        for entry in self.entries:
+            entry.nextDue = now
+
+    def setEntries(self, entries: list[PollEntry]):
+        """Replace the polled entries, the ones already scheduled keep their due time"""
+        known = set(map(id, self.entries))
+        now = time.monotonic()
+        for entry in entries:
+            if id(entry) not in known:
+                entry.nextDue = now
+
+        self.entries = list(entries)
+
+    def due(self, now: float) -> list[PollEntry]:
+        due = [e for e in self.entries if e.nextDue <= now]
+        due.sort(key=lambda e: (e.priority, e.nextDue))
+
+        fits = max(1, int(self.slot * self.busShare / self.readTime))
+        return self.interleave(due[:fits])
+
+    @staticmethod
+    def interleave(batch: list[PollEntry]) -> list[PollEntry]:
+        """
+        Alternate between destination addresses so that a single slow or
+        missing unit does not delay all the reads of the others
+        """
+        byAddr: dict[int, list[PollEntry]] = dict()
+        for entry in batch:
+            byAddr.setdefault(entry.dstAddr, list()).append(entry)
+
+        if len(byAddr) < 2:
+            return batch
+
+        queues = list(byAddr.values())
+        result = list()
+        for i in range(max(len(q) for q in queues)):
+            result.extend(q[i] for q in queues if i < len(q))
+
+        return result
+
+    def complete(self, entry: PollEntry, now: float, duration: float):
+        # exponentially weighted estimate of the bus time per read
+        self.readTime = 0.8 * self.readTime + 0.2 * duration
+
+        entry.nextDue += entry.interval
+        if entry.nextDue < now:
+            # we fell behind, do not try to catch up with a burst
+            entry.nextDue = now + entry.interval
+
+    def nextWakeup(self) -> float:
+        return min(e.nextDue for e in self.entries)
+
+    def step(self, read: Callable, onValue: Callable, onError: Callable = None,
+            readMany: Callable = None) -> list[PollEntry]:
+        stepStart = time.monotonic()
+        batch = self.due(stepStart)
+
+        if readMany is not None:
+            self._stepMany(batch, readMany, onValue, onError)
+        else:
+            self._stepEach(batch, read, onValue, onError)
+
+        self.lastStepDuration = time.monotonic() - stepStart
+        return batch
+
+    def _stepEach(self, batch: list[PollEntry], read: Callable, onValue: Callable,
+            onError: Callable = None):
+        for entry in batch:
+            start = time.monotonic()
+            try:
+                value = read(entry)
+            except Exception as e:
+                if onError is None:
+                    raise
+                onError(entry, e)
+            else:
+                onValue(entry, value)
+            finally:
+                end = time.monotonic()
+                self.complete(entry, end, end - start)
+
+    def _stepMany(self, batch: list[PollEntry], readMany: Callable, onValue: Callable,
+            onError: Callable = None):
+        """
+        readMany(batch) returns a value or an exception for every entry, which
+        lets pipelining transports overlap the reads of a slot
+        """
+        start = time.monotonic()
+        results = readMany(batch)
+        end = time.monotonic()
+
+        duration = (end - start) / max(1, len(batch))
+        for entry, value in zip(batch, results):
+            if isinstance(value, Exception):
+                if onError is None:
+                    raise value
+                onError(entry, value)
+            else:
+                onValue(entry, value)
+            self.complete(entry, end, duration)
+
+    def run(self, read: Callable, onValue: Callable, onError: Callable = None,
+            onSlot: Callable = None, readMany: Callable = None, stop: threading.Event = None,
+            beforeStep: Callable = None, wakeup: threading.Event = None):
+        """
+        Poll until `stop` is set, or forever without it. beforeStep() is
+        called ahead of the reads of every step (e.g. to send pending
+        writes), setting `wakeup` ends the wait for the next step early.
+        With `wakeup`, only that event is waited for: whoever sets `stop`
+        has to set `wakeup` too, or the loop ends after the current wait.
+        """
+        while stop is None or not stop.is_set():
+            if beforeStep is not None:
+                beforeStep()
+
+            batch = self.step(read, onValue, onError, readMany)
+            if onSlot is not None and batch:
+                onSlot(batch)
+
+            delay = self.nextWakeup() - time.monotonic()
+            if delay > 0:
+                if wakeup is not None:
+                    wakeup.wait(delay)
+                    wakeup.clear()
+                    # woken up by stop, no beforeStep() nor reads anymore
+                    if stop is not None and stop.is_set():
+                        break
+                elif stop is None:
+                    time.sleep(delay)
+                else:
+                    stop.wait(delay)
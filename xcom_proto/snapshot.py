@@ -0,0 +1,232 @@
+#! /usr/bin/env python3
+
+##
+# Backup and audit of the configuration: saved value, limits and user level
+# of every parameter of every unit, stored as a gzipped JSON file. A snapshot
+# taken on top of the previous one only reads the saved values again, the
+# limits are fixed by the firmware and copied until they are LIMITS_MAX_AGE
+# old.
+#
+# usage: python -m xcom_proto.snapshot (--serial DEVICE | --udp HOST | --tcp PORT)
+#                                      --output FILE [--previous FILE] [--rate N]
+##
+
+import os
+import gzip
+import json
+import time
+import logging
+import argparse
+
+from dataclasses import dataclass, field
+
+from .parameters import *
+
+# properties read for every parameter, by their name in the snapshot file
+PROPERTIES = {"value": QSP_VALUE, "min": QSP_MIN, "max": QSP_MAX, "level": QSP_LEVEL}
+LIMITS = ("min", "max", "level")
+
+# limits older than this are read again by an incremental snapshot
+LIMITS_MAX_AGE = 30 * 24 * 3600
+
+# requests sent together, the pause needed to respect the rate is taken
+# between two batches
+BATCH_SIZE = 8
+
+LEVEL_NAMES = {
+    0x00: "VIEW_ONLY",
+    0x10: "BASIC",
+    0x20: "EXPERT",
+    0x30: "INSTALLER",
+    0x40: "QSP",
+}
+
+def snapshotParameters() -> list[Datapoint]:
+    """Parameters of the Dataset, once per object id"""
+    # XcomAbs imports this module
+    from .XcomAbs import getObjectType
+
+    seen = set()
+    parameters = list()
+
+    for point in Dataset.registry():
+        if getObjectType(point.id) != TYPE_PARAMETER or point.id in seen:
+            continue
+        seen.add(point.id)
+        parameters.append(point)
+
+    return parameters
+
+@dataclass
+class Snapshot:
+    taken: float
+    devices: dict[str, list[int]]
+    # (address, object id) -> {"name", "value", "min", "max", "level", "limits" (time read), "error"}
+    parameters: dict[tuple[int, int], dict] = field(default_factory=dict)
+    requests: int = 0       # requests sent to take this snapshot
+
+    def save(self, path: str):
+        """Written to a temporary file first, a crash never leaves a truncated snapshot"""
+        data = {
+            "taken": self.taken,
+            "devices": self.devices,
+            "parameters": {f"{addr}:{id}": entry for (addr, id), entry in self.parameters.items()},
+        }
+
+        with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def load(path: str) -> "Snapshot":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+
+        parameters = dict()
+        for key, entry in data["parameters"].items():
+            addr, id = key.split(":")
+            parameters[(int(addr), int(id))] = entry
+
+        return Snapshot(data["taken"], data["devices"], parameters)
+
+@dataclass
+class Change:
+    dstAddr: int
+    name: str
+    property: str
+    old: object
+    new: object
+
+    def __str__(self) -> str:
+        old, new = self.old, self.new
+        if self.property == "level":
+            old, new = LEVEL_NAMES.get(old, old), LEVEL_NAMES.get(new, new)
+        return f"{self.name}@{self.dstAddr} {self.property}: {old} -> {new}"
+
+def diffSnapshots(old: Snapshot, new: Snapshot) -> list[Change]:
+    """Properties which differ, parameters missing from one side compare to None"""
+    changes = list()
+
+    for key in sorted(old.parameters.keys() | new.parameters.keys()):
+        before = old.parameters.get(key, {})
+        after = new.parameters.get(key, {})
+        name = after.get("name") or before.get("name")
+
+        for prop in (*PROPERTIES, "error"):
+            if before.get(prop) != after.get(prop):
+                changes.append(Change(key[0], name, prop, before.get(prop), after.get(prop)))
+
+    return changes
+
+def takeSnapshot(xcom, devices: dict[str, list[int]] = None, previous: Snapshot = None,
+        parameters: list[Datapoint] = None, rate: float = None) -> Snapshot:
+    """
+    Read the parameters of every unit in `devices` (the units found by
+    xcom.scanDevices by default). With a previous snapshot of the same
+    units, only the values and the limits older than LIMITS_MAX_AGE are
+    read. At most `rate` requests per second are sent, leaving the rest of
+    the bus to the polling.
+    """
+    devices = devices or xcom.devices or xcom.scanDevices()
+    parameters = parameters or snapshotParameters()
+    now = time.time()
+
+    reads = [(p, addr) for p in parameters for addr in devices.get(getDeviceType(p.id), ())]
+    snapshot = Snapshot(now, devices)
+    reader = _PacedReader(xcom, rate)
+
+    for (p, addr), value in zip(reads, reader.read(reads, QSP_VALUE)):
+        entry = {"name": p.name, "value": None if isinstance(value, Exception) else value}
+        if isinstance(value, Exception):
+            entry["error"] = str(value.args[-1]) if isinstance(value, KeyError) else type(value).__name__
+        snapshot.parameters[(addr, p.id)] = entry
+
+    # limits still known from the previous snapshot
+    stale = list()
+    for p, addr in reads:
+        entry = snapshot.parameters[(addr, p.id)]
+        known = previous.parameters.get((addr, p.id)) if previous is not None else None
+        if known is not None and "limits" in known and now - known["limits"] <= LIMITS_MAX_AGE:
+            entry.update({prop: known.get(prop) for prop in LIMITS}, limits=known["limits"])
+        elif "error" not in entry:
+            stale.append((p, addr))
+
+    for prop in LIMITS:
+        # the level is an enum whatever the type of the parameter
+        limitReads = [(Datapoint(p.id, p.name, TYPE_SHORT_ENUM), addr) if prop == "level" else (p, addr)
+            for p, addr in stale]
+        for (p, addr), value in zip(stale, reader.read(limitReads, PROPERTIES[prop])):
+            snapshot.parameters[(addr, p.id)][prop] = None if isinstance(value, Exception) else value
+
+    for p, addr in stale:
+        snapshot.parameters[(addr, p.id)]["limits"] = now
+
+    snapshot.requests = reader.requests
+    return snapshot
+
+class _PacedReader:
+
+    def __init__(self, xcom, rate: float = None):
+        self.xcom = xcom
+        self.rate = rate
+        self.requests = 0
+        self._start = time.monotonic()
+
+    def read(self, reads: list[tuple[Datapoint, int]], propertyID: bytes) -> list:
+        values = list()
+
+        for i in range(0, len(reads), BATCH_SIZE):
+            batch = reads[i:i + BATCH_SIZE]
+            if self.rate:
+                # wait until the requests already sent fit into the rate
+                delay = self._start + self.requests / self.rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+            # never from the value cache, the snapshot has to be current
+            values.extend(self.xcom.getValuesFrom(batch, propertyID, return_exceptions=True, maxAge=0))
+            self.requests += len(batch)
+
+        return values
+
+if __name__ == "__main__":
+    from . import XcomRS232, XcomLANUDP, XcomLANTCP
+
+    parser = argparse.ArgumentParser(description="Saves the parameters of the installation and shows what changed")
+    parser.add_argument("--serial", metavar="DEVICE", help="Xcom-232i serial port")
+    parser.add_argument("--baudrate", type=int, default=115200)
+    parser.add_argument("--udp", metavar="HOST", help="Xcom-LAN address")
+    parser.add_argument("--udp-port", type=int, default=4002)
+    parser.add_argument("--udp-reply", type=int, default=4001)
+    parser.add_argument("--tcp", type=int, metavar="PORT", help="wait for the Xcom-LAN on this TCP port")
+    parser.add_argument("--output", required=True, metavar="FILE", help="snapshot file (.json.gz)")
+    parser.add_argument("--previous", metavar="FILE", help="previous snapshot, --output by default")
+    parser.add_argument("--full", action="store_true", help="read everything again")
+    parser.add_argument("--rate", type=float, help="maximum requests per second")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if args.serial:
+        xcom = XcomRS232(args.serial, args.baudrate)
+    elif args.udp:
+        xcom = XcomLANUDP(args.udp, args.udp_port, args.udp_reply)
+    elif args.tcp:
+        xcom = XcomLANTCP(args.tcp)
+    else:
+        parser.error("one of --serial, --udp or --tcp is required")
+
+    previousPath = args.previous or args.output
+    previous = Snapshot.load(previousPath) if os.path.exists(previousPath) else None
+
+    with xcom:
+        start = time.monotonic()
+        snapshot = takeSnapshot(xcom, previous.devices if previous and not args.full else None,
+            None if args.full else previous, rate=args.rate)
+        print(f"{len(snapshot.parameters)} parameters, {snapshot.requests} requests in {time.monotonic() - start:.1f}s")
+
+    if previous is not None:
+        for change in diffSnapshots(previous, snapshot):
+            print(change)
+
+    snapshot.save(args.output)